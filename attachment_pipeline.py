@@ -0,0 +1,262 @@
+import bz2
+import gzip
+import logging
+import lzma
+import os
+import shutil
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# (offset, magic bytes, file type), checked in order
+MAGIC_SIGNATURES = [
+    (0, b'\x7fELF', 'elf'),
+    (0, b'MZ', 'pe'),
+    (0, b'\xfe\xed\xfa\xce', 'macho'),
+    (0, b'\xfe\xed\xfa\xcf', 'macho'),
+    (0, b'\xce\xfa\xed\xfe', 'macho'),
+    (0, b'\xcf\xfa\xed\xfe', 'macho'),
+    (0, b'\xca\xfe\xba\xbe', 'java_class'), # Also fat Mach-O, rarely seen in CTFs
+    (0, b'\xd4\xc3\xb2\xa1', 'pcap'),
+    (0, b'\xa1\xb2\xc3\xd4', 'pcap'),
+    (0, b'\x4d\x3c\xb2\xa1', 'pcap'),
+    (0, b'\xa1\xb2\x3c\x4d', 'pcap'),
+    (0, b'\x0a\x0d\x0d\x0a', 'pcapng'),
+    (0, b'%PDF-', 'pdf'),
+    (0, b'PK\x03\x04', 'zip'),
+    (0, b'PK\x05\x06', 'zip'), # Empty zip
+    (0, b'\x1f\x8b', 'gzip'),
+    (0, b'BZh', 'bzip2'),
+    (0, b'\xfd7zXZ\x00', 'xz'),
+    (0, b"7z\xbc\xaf'\x1c", '7z'),
+    (0, b'Rar!\x1a\x07', 'rar'),
+    (257, b'ustar', 'tar'),
+    (0, b'\x89PNG\r\n\x1a\n', 'png'),
+    (0, b'\xff\xd8\xff', 'jpeg'),
+    (0, b'GIF87a', 'gif'),
+    (0, b'GIF89a', 'gif'),
+    (0, b'RIFF', 'riff'), # wav, avi, webp
+    (0, b'SQLite format 3\x00', 'sqlite'),
+    (0, b'\x00asm', 'wasm'),
+    (0, b'-----BEGIN ', 'pem'),
+]
+_HEADER_SIZE = 512
+ARCHIVE_TYPES = {'zip', 'tar', 'gzip', 'bzip2', 'xz'}
+
+class ExtractionLimitError(Exception):
+    pass
+
+def classify_file(path: str):
+    # File type from the magic bytes, 'text' or 'data' if unknown
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER_SIZE)
+
+    for offset, magic, file_type in MAGIC_SIGNATURES:
+        if header[offset:offset + len(magic)] == magic:
+            return file_type
+
+    if not header:
+        return 'empty'
+    if b'\x00' not in header:
+        try:
+            header.decode('utf-8')
+            return 'text'
+        except UnicodeDecodeError as e:
+            if e.start >= len(header) - 3: # Multi-byte char cut by the header size
+                return 'text'
+    return 'data'
+
+def _safe_destination_path(destination: str, member_name: str):
+    # Where a member of an archive can be extracted, None if it would end up outside 'destination'
+    member_name = member_name.replace('\\', '/')
+    if not member_name or member_name.startswith('/') or os.path.splitdrive(member_name)[0]:
+        return None
+
+    real_destination = os.path.realpath(destination)
+    target_path = os.path.realpath(os.path.join(real_destination, os.path.normpath(member_name)))
+    if os.path.commonpath([real_destination, target_path]) != real_destination or target_path == real_destination:
+        return None
+    return target_path
+
+def _remaining_bytes(max_total_bytes, used_bytes: int):
+    # None means no limit
+    return None if max_total_bytes is None else max_total_bytes - used_bytes
+
+def _copy_limited(source, target_path: str, max_bytes: int = None):
+    # Copy from a file object, counting the real bytes (archive headers can lie). Return the copied size.
+    # max_bytes None means no limit
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    copied = 0
+    try:
+        with open(target_path, 'wb') as target:
+            while True:
+                chunk = source.read(64 * 1024)
+                if not chunk:
+                    break
+                copied += len(chunk)
+                if max_bytes is not None and copied > max_bytes:
+                    raise ExtractionLimitError(f"more than {max_bytes} bytes extracted")
+                target.write(chunk)
+    except ExtractionLimitError:
+        os.remove(target_path)
+        raise
+    return copied
+
+def _extract_zip(archive_path, destination, max_total_bytes, max_files, skipped):
+    extracted = []
+    total_bytes = 0
+    with zipfile.ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            if max_files is not None and len(extracted) >= max_files:
+                raise ExtractionLimitError(f"more than {max_files} files")
+
+            target_path = _safe_destination_path(destination, member.filename)
+            if target_path is None:
+                skipped.append(member.filename)
+                continue
+
+            with archive.open(member) as source:
+                total_bytes += _copy_limited(source, target_path, _remaining_bytes(max_total_bytes, total_bytes))
+            extracted.append(target_path)
+    return extracted
+
+def _extract_tar(archive_path, destination, max_total_bytes, max_files, skipped):
+    extracted = []
+    total_bytes = 0
+    with tarfile.open(archive_path, 'r:*') as archive:
+        for member in archive:
+            if not member.isfile(): # No links, devices, ...
+                if not member.isdir():
+                    skipped.append(member.name)
+                continue
+            if max_files is not None and len(extracted) >= max_files:
+                raise ExtractionLimitError(f"more than {max_files} files")
+
+            target_path = _safe_destination_path(destination, member.name)
+            if target_path is None:
+                skipped.append(member.name)
+                continue
+
+            source = archive.extractfile(member)
+            with source:
+                total_bytes += _copy_limited(source, target_path, _remaining_bytes(max_total_bytes, total_bytes))
+            extracted.append(target_path)
+    return extracted
+
+def _extract_compressed_file(archive_path, file_type, destination, max_total_bytes):
+    # Single compressed file (e.g. flag.txt.gz)
+    open_functions = {'gzip': gzip.open, 'bzip2': bz2.open, 'xz': lzma.open}
+    name, extension = os.path.splitext(os.path.basename(archive_path))
+    if extension.lower() not in ('.gz', '.bz2', '.xz'):
+        name = os.path.basename(archive_path)
+
+    target_path = os.path.join(destination, name)
+    with open_functions[file_type](archive_path) as source:
+        _copy_limited(source, target_path, max_total_bytes)
+    return [target_path]
+
+def extract_archive(archive_path: str, file_type: str, destination: str, max_total_bytes: int, max_files: int, skipped: list = None):
+    # Extract an archive, return the paths of the extracted files. A None limit means no limit.
+    # Members with unsafe paths (absolute, '..') and links are not extracted, their names go in 'skipped'.
+    # Raise ExtractionLimitError if it's too large (what was extracted so far is kept)
+    if skipped is None:
+        skipped = []
+    if file_type == 'zip':
+        return _extract_zip(archive_path, destination, max_total_bytes, max_files, skipped)
+    if file_type == 'tar' or (file_type in ('gzip', 'bzip2', 'xz') and tarfile.is_tarfile(archive_path)):
+        return _extract_tar(archive_path, destination, max_total_bytes, max_files, skipped)
+    if file_type in ('gzip', 'bzip2', 'xz'):
+        return _extract_compressed_file(archive_path, file_type, destination, max_total_bytes)
+    return []
+
+def get_extraction_folder(attachment_path: str):
+    # 'challenge/files.tar.gz' -> 'challenge/files_extracted'
+    name = os.path.basename(attachment_path)
+    for extension in ('.tar.gz', '.tar.bz2', '.tar.xz', '.tgz', '.zip', '.tar', '.gz', '.bz2', '.xz'):
+        if name.lower().endswith(extension) and len(name) > len(extension):
+            name = name[:-len(extension)]
+            break
+    return os.path.join(os.path.dirname(attachment_path), name + '_extracted')
+
+def process_attachment(attachment_path: str, extract: bool, max_total_bytes: int, max_files: int):
+    # Runs in a worker process.
+    # Return {'file_type', 'extracted': [{'path', 'file_type'}], 'skipped', 'error'}, paths relative to the attachment folder.
+    # Nothing is logged here, logging is not set up in the workers
+    result = {'file_type': None, 'extracted': [], 'skipped': [], 'error': None}
+    try:
+        result['file_type'] = classify_file(attachment_path)
+        if not extract or result['file_type'] not in ARCHIVE_TYPES:
+            return result
+
+        destination = get_extraction_folder(attachment_path)
+        if os.path.isdir(destination):
+            shutil.rmtree(destination) # Extracted from an older version of the file
+        os.makedirs(destination)
+
+        extracted_paths = []
+        try:
+            extracted_paths = extract_archive(attachment_path, result['file_type'], destination, max_total_bytes, max_files, result['skipped'])
+        except ExtractionLimitError as e:
+            result['error'] = f"Extraction stopped: {e}"
+            extracted_paths = [os.path.join(root, name) for root, _, names in os.walk(destination) for name in names]
+
+        attachment_folder = os.path.dirname(attachment_path)
+        for path in extracted_paths:
+            result['extracted'].append({
+                'path': os.path.relpath(path, attachment_folder),
+                'file_type': classify_file(path),
+            })
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+class AttachmentPipeline:
+    # Classify (and extract) downloaded attachments on a process pool, while the update keeps downloading
+    def __init__(self, workers=None, extract=True, max_extracted_bytes=1024 ** 3, max_extracted_files=10000):
+        self.workers = workers
+        self.extract = extract
+        self.max_extracted_bytes = max_extracted_bytes
+        self.max_extracted_files = max_extracted_files
+
+        self._executor = None
+        self._pending = [] # (Attachment, future)
+
+    def submit(self, attachment, attachment_path: str):
+        # The results are written into 'attachment' by collect()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        future = self._executor.submit(process_attachment, attachment_path, self.extract, self.max_extracted_bytes, self.max_extracted_files)
+        self._pending.append((attachment, future))
+
+    def collect(self, wait=False):
+        # Store the finished results into their attachments. With wait=True, wait for all of them
+        still_pending = []
+        for attachment, future in self._pending:
+            if not wait and not future.done():
+                still_pending.append((attachment, future))
+                continue
+
+            try:
+                result = future.result()
+            except Exception as e: # e.g. BrokenProcessPool
+                result = {'file_type': None, 'extracted': [], 'skipped': [], 'error': f"{type(e).__name__}: {e}"}
+
+            attachment.file_type = result['file_type']
+            attachment.extracted = result['extracted']
+            if result['skipped']:
+                logger.warning(f"Not extracted from '{attachment.name}' (unsafe path or link): {', '.join(result['skipped'])}")
+            if result['error']:
+                logger.warning(f"Error processing attachment '{attachment.name}': {result['error']}")
+            elif attachment.extracted:
+                logger.debug(f"Extracted {len(attachment.extracted)} files from '{attachment.name}' ({attachment.file_type})")
+        self._pending = still_pending
+
+    def shutdown(self):
+        self.collect(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,93 @@
+import os
+from dataclasses import dataclass, field, fields
+from urllib.parse import urlparse, unquote
+
+def get_filename_from_url(url: str):
+    try:
+        path = urlparse(url).path
+        filename = os.path.basename(path)
+        return unquote(filename)
+    except Exception:
+        # fallback if URL is malformed or unexpected
+        return "unknown_file"
+
+@dataclass(slots=True)
+class Attachment:
+    url: str
+    name: str = ''
+    size: int | None = None # Bytes, None if unknown
+    file_type: str | None = None # From the magic bytes, see attachment_pipeline.classify_file
+    extracted: list[dict] = field(default_factory=list) # Files extracted from the archive: {'path', 'file_type'}
+
+    def __post_init__(self):
+        if not self.name:
+            self.name = get_filename_from_url(self.url)
+
+    def to_dict(self):
+        return {'url': self.url, 'name': self.name, 'size': self.size, 'file_type': self.file_type, 'extracted': self.extracted}
+
+    @classmethod
+    def from_dict(cls, data):
+        # Old state files store attachments as plain URLs
+        if isinstance(data, str):
+            return cls(data)
+        return cls(data['url'], data.get('name', ''), data.get('size'), data.get('file_type'), data.get('extracted', []))
+
+@dataclass(slots=True)
+class ChallengeSummary:
+    # Challenge as returned by the challenges list of a platform
+    id: int | str
+    name: str | None = None
+    category: str | None = None
+    value: int | None = None
+    solves: int | None = None
+    solved_by_me: bool | None = None
+    platform: str | None = None
+    pending: bool = False
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self._field_names()}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        # Unknown keys are ignored
+        return cls(**{name: data[name] for name in cls._field_names() if name in data})
+
+    @classmethod
+    def _field_names(cls):
+        # Cached per class, fields() is slow to call for every record
+        names = cls.__dict__.get('_FIELD_NAMES')
+        if names is None:
+            names = tuple(f.name for f in fields(cls))
+            setattr(cls, '_FIELD_NAMES', names)
+        return names
+
+@dataclass(slots=True)
+class ChallengeDetails(ChallengeSummary):
+    # Challenge with all its details, this is what gets stored in the state
+    description: str | None = None
+    files: list[Attachment] = field(default_factory=list)
+    need_download_again: bool = False
+    deferred_files: list[Attachment] = field(default_factory=list) # Skipped because of the download budget
+    solved_by: dict[str, bool] = field(default_factory=dict) # Solve status of each account of the platform
+    folder: str | None = None # Challenge folder, relative to the main challenges directory
+    first_seen: int | None = None # Unix time of the first update that saw it
+
+    def to_dict(self):
+        data = ChallengeSummary.to_dict(self)
+        data['files'] = [f.to_dict() for f in self.files]
+        data['deferred_files'] = [f.to_dict() for f in self.deferred_files]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        chal = super(ChallengeDetails, cls).from_dict(data)
+        chal.files = [Attachment.from_dict(f) for f in chal.files]
+        chal.deferred_files = [Attachment.from_dict(f) for f in chal.deferred_files]
+        return chal
+
+    @classmethod
+    def from_summary(cls, summary: ChallengeSummary):
+        if isinstance(summary, cls):
+            return summary
+        return cls(**{name: getattr(summary, name) for name in ChallengeSummary._field_names()})
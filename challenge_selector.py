@@ -0,0 +1,129 @@
+import math
+import operator
+import re
+import shlex
+import time
+
+from challenge_record import ChallengeSummary, ChallengeDetails
+
+# Value of a field for a challenge of the list ('chal') and its record in the state ('stored', None if new).
+# None means unknown: a condition on an unknown value is true, the challenge is fetched to find out
+def _get_has_files(chal, stored, now):
+    if stored is None or (not stored.files and not stored.deferred_files and stored.description is None):
+        return None # Details never downloaded
+    return bool(stored.files or stored.deferred_files)
+
+def _get_age(chal, stored, now):
+    if stored is None:
+        return 0 # First seen now
+    if stored.first_seen is None:
+        # Already in the state before first_seen was tracked: older than anything tracked.
+        # An unknown age would match 'age<30d' and select every old challenge
+        return math.inf
+    return now - stored.first_seen
+
+SELECTOR_FIELDS = {
+    # name: (type, getter)
+    'solved_by_me': ('bool', lambda chal, stored, now: chal.solved_by_me if chal.solved_by_me is not None else (stored.solved_by_me if stored else None)),
+    'value': ('number', lambda chal, stored, now: chal.value if chal.value is not None else (stored.value if stored else None)),
+    'solves': ('number', lambda chal, stored, now: chal.solves if chal.solves is not None else (stored.solves if stored else None)),
+    'age': ('duration', _get_age), # Time since the challenge was first seen
+    'has_files': ('bool', _get_has_files),
+    'platform': ('text', lambda chal, stored, now: chal.platform),
+    'category': ('text', lambda chal, stored, now: chal.category or 'dunno'),
+}
+
+_OPERATORS = {'=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+_TERM_PATTERN = re.compile(r'^(\w+)\s*(<=|>=|!=|=|<|>)\s*(.+)$')
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+_BOOLEANS = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+
+def parse_duration(duration_string: str):
+    # "90s", "30m", "12h", "7d", "2w" -> seconds. A number alone is in days
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([smhdw]?)', duration_string.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid duration '{duration_string}' (e.g. 12h, 7d, 2w)")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or 'd']
+
+def _parse_value(field_type: str, value_string: str):
+    if field_type == 'bool':
+        if value_string.lower() not in _BOOLEANS:
+            raise ValueError(f"'{value_string}' is not true or false")
+        return _BOOLEANS[value_string.lower()]
+    if field_type == 'number':
+        try:
+            return float(value_string)
+        except ValueError:
+            raise ValueError(f"'{value_string}' is not a number")
+    if field_type == 'duration':
+        return parse_duration(value_string)
+    return value_string.lower()
+
+class ChallengeSelector:
+    # Which pending challenges an update downloads, e.g. "solved_by_me=false value>=200 age<30d has_files=true".
+    # Terms are separated by spaces and must all be true. Supported forms:
+    #   field=value, field!=value, field<value (also <=, >, >=) for numbers and ages
+    #   value=100..500                     inclusive range
+    #   category=pwn|rev                   any of these (text fields)
+    #   category="reverse engineering"     quotes for values with spaces
+    # It only looks at the challenges list and the local state, so unselected challenges cost no requests
+    def __init__(self, conditions: list[tuple]):
+        self.conditions = conditions # [(field, test function)]
+
+    @classmethod
+    def from_string(cls, selector_string: str):
+        # Raise ValueError if the selector is not valid
+        try:
+            terms = shlex.split(selector_string)
+        except ValueError as e:
+            raise ValueError(f"Invalid selector: {e}")
+
+        conditions = []
+        for term in terms:
+            match = _TERM_PATTERN.match(term)
+            if not match:
+                raise ValueError(f"Invalid term '{term}' (expected field=value, field<value, ...)")
+            field_name, op, value_string = match.group(1).lower(), match.group(2), match.group(3).strip()
+            if field_name not in SELECTOR_FIELDS:
+                raise ValueError(f"Unknown field '{field_name}'. Valid fields: {', '.join(SELECTOR_FIELDS)}")
+            try:
+                conditions.append((field_name, cls._make_test(SELECTOR_FIELDS[field_name][0], op, value_string)))
+            except ValueError as e:
+                raise ValueError(f"Invalid term '{term}': {e}")
+        return cls(conditions)
+
+    @staticmethod
+    def _make_test(field_type: str, op: str, value_string: str):
+        if field_type in ('number', 'duration') and '..' in value_string:
+            if op != '=':
+                raise ValueError("ranges only work with '='")
+            low_string, high_string = value_string.split('..', 1)
+            low = _parse_value(field_type, low_string) if low_string.strip() else None
+            high = _parse_value(field_type, high_string) if high_string.strip() else None
+            return lambda actual: (low is None or actual >= low) and (high is None or actual <= high)
+
+        if field_type == 'text':
+            if op not in ('=', '!='):
+                raise ValueError("text fields only support '=' and '!='")
+            options = {option.strip().lower() for option in value_string.split('|')}
+            if op == '=':
+                return lambda actual: actual.lower() in options
+            return lambda actual: actual.lower() not in options
+
+        if field_type == 'bool' and op not in ('=', '!='):
+            raise ValueError("true/false fields only support '=' and '!='")
+        expected = _parse_value(field_type, value_string)
+        compare = _OPERATORS[op]
+        if field_type == 'bool':
+            return lambda actual: compare(bool(actual), expected)
+        return lambda actual: compare(actual, expected)
+
+    def matches(self, chal: ChallengeSummary, stored: ChallengeDetails = None, now: float = None):
+        # 'stored' is the challenge in the state before this update (None if new)
+        if now is None:
+            now = time.time()
+        for field_name, test in self.conditions:
+            actual = SELECTOR_FIELDS[field_name][1](chal, stored, now)
+            if actual is not None and not test(actual):
+                return False
+        return True
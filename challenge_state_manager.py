@@ -1,13 +1,33 @@
 import json
+import logging
 import os
-from urllib.parse import urlparse, unquote
+import sqlite3
+import time
+
+from challenge_record import ChallengeSummary, ChallengeDetails, get_filename_from_url
+from update_scheduler import UpdateScheduler
+from download_budget import DownloadBudget, BudgetExceededError, format_size
+from logging_setup import progress
+from search_index import SearchIndex
+from attachment_pipeline import AttachmentPipeline
+from challenge_selector import ChallengeSelector
+
+logger = logging.getLogger(__name__)
 
 class ChallengeStateManager:
-    def __init__(self, state_file_name='challenge_state.json', main_challenges_dir='../ctf'):
+    def __init__(self, state_file_name='challenge_state.json', main_challenges_dir='../ctf', checkpoint_interval=30, search_index: SearchIndex = None, attachment_pipeline: AttachmentPipeline = None):
         # Note: state_file_name is just the name, not the full path
         self.state_file_name = state_file_name
         self.challenges_directory = main_challenges_dir
+        # Seconds between two state saves during an update (None to save only at the end)
+        self.checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = time.monotonic()
+        # Updated every time a challenge is written (optional)
+        self.search_index = search_index
+        # Classifies and extracts the downloaded attachments in the background (optional)
+        self.attachment_pipeline = attachment_pipeline
       
+        # {platform_key: {challenge_id: ChallengeDetails}}
         self.state = self.load_state()
     
     def _get_full_state_file_path(self):
@@ -19,7 +39,7 @@ class ChallengeStateManager:
     def load_state(self):
         if not os.path.exists(self.challenges_directory):
             os.makedirs(self.challenges_directory, exist_ok=True)
-            print(f"Created main challenges directory: {self.challenges_directory}")
+            logger.info(f"Created main challenges directory: {self.challenges_directory}")
         
         full_state_path = self._get_full_state_file_path()
         if os.path.exists(full_state_path):
@@ -29,39 +49,77 @@ class ChallengeStateManager:
                     
                     # Reset if not dictionary
                     if not isinstance(loaded_state, dict):
-                        print(f"Warning: State file at {full_state_path} is not in the expected dictionary format. Initializing empty state.")
+                        logger.warning(f"State file at {full_state_path} is not in the expected dictionary format. Initializing empty state.")
                         return {}
-                    return loaded_state
+                    return self._state_from_json(loaded_state)
             except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from state file {full_state_path}: {e}. Initializing empty state.")
+                logger.error(f"Error decoding JSON from state file {full_state_path}: {e}. Initializing empty state.")
                 return {}
             except Exception as e:
-                print(f"Error opening state file {full_state_path}: {e}. Initializing empty state.")
+                logger.error(f"Error opening state file {full_state_path}: {e}. Initializing empty state.")
                 return {}
         return {} # Return empty dict if file doesn't exist
     
     def save_state(self):
         full_state_path = self._get_full_state_file_path()
+        # Written to a temporary file first: an interrupted save (Ctrl-C during a checkpoint) keeps the old state file
+        temp_state_path = full_state_path + '.tmp'
         try:
-            with open(full_state_path, 'w', encoding='utf-8') as f:
-                json.dump(self.state, f, indent=4, ensure_ascii=False)
+            with open(temp_state_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state_to_json(), f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_state_path, full_state_path)
         except Exception as e:
-            print(f"Error saving state file {full_state_path}: {e}")
+            logger.error(f"Error saving state file {full_state_path}: {e}")
+        
+        if self.search_index is not None:
+            self.search_index.commit()
+            
+    @staticmethod
+    def _state_from_json(loaded_state: dict):
+        state = {}
+        for platform_key, platform_challenges in loaded_state.items():
+            state[platform_key] = {}
+            for chal_dict in platform_challenges:
+                try:
+                    chal = ChallengeDetails.from_dict(chal_dict)
+                except (TypeError, KeyError) as e:
+                    logger.warning(f"Skipping malformed challenge in state for '{platform_key}': {e}")
+                    continue
+                state[platform_key][chal.id] = chal
+        return state
+
+    def _state_to_json(self):
+        return {platform_key: [chal.to_dict() for chal in platform_challenges.values()]
+                for platform_key, platform_challenges in self.state.items()}
             
     def get_challenge_from_state(self, platform_key, challenge_id):
-        platform_challenges = self.state.get(platform_key, [])
-        for chal in platform_challenges:
-            if chal.get('id') == challenge_id:
-                return chal
-        return {} # Return empty dict if not found
+        # Return None if not found
+        return self.state.get(platform_key, {}).get(challenge_id)
+
+    def is_new_challenge(self, platform_key, challenge_id):
+        # Not in the state, or only seen in a challenges list: its details were never downloaded
+        chal = self.get_challenge_from_state(platform_key, challenge_id)
+        return chal is None or (chal.folder is None and chal.description is None)
+
+    def record_new_challenges(self, all_challenges: list):
+        # Add the challenges seen for the first time without downloading anything (they stay pending),
+        # so their age counts from the first sync that listed them even when it doesn't update them
+        now = int(time.time())
+        for chal_data_from_web in all_challenges:
+            if self.get_challenge_from_state(chal_data_from_web.platform, chal_data_from_web.id) is None:
+                new_chal = ChallengeDetails.from_summary(chal_data_from_web)
+                new_chal.pending = True
+                new_chal.first_seen = now
+                self.state.setdefault(chal_data_from_web.platform, {})[chal_data_from_web.id] = new_chal
 
-    def is_pending(self, new_website_chal_data: dict):
-        platform_key = new_website_chal_data.get('platform')
-        challenge_id = new_website_chal_data.get('id')
+    def is_pending(self, new_website_chal_data: ChallengeSummary):
+        platform_key = new_website_chal_data.platform
+        challenge_id = new_website_chal_data.id
 
         if not platform_key or not challenge_id:
-            print("Error: Challenge data missing 'platform' or 'id' for 'is_pending' check.")
-            print(new_website_chal_data)
+            logger.error(f"Challenge data missing 'platform' or 'id' for 'is_pending' check: {new_website_chal_data}")
             return False # Cannot determine, assume not pending or handle as error
         
         old_data = self.get_challenge_from_state(platform_key, challenge_id)
@@ -71,167 +129,398 @@ class ChallengeStateManager:
             return True
         
         # If pending is true, return immediatly
-        if old_data['pending']:
+        if old_data.pending:
             return True
         
         # Fields to check for changes
-        fields_to_compare = ['value', 'solves']
-        for field in fields_to_compare:
-            if new_website_chal_data.get(field) != old_data.get(field):
-                return True # Pending if any field differs
+        if new_website_chal_data.value != old_data.value or new_website_chal_data.solves != old_data.solves:
+            return True # Pending if any field differs
+        
+        # Older state files have no category for platforms that only send it in the list (OliCyber, CyberChallenge):
+        # the folder was made with the category of the list, take it from there
+        if old_data.category is None:
+            old_data.category = new_website_chal_data.category
+        
+        # Renamed or moved to another category: its folder must be moved
+        if new_website_chal_data.name != old_data.name or (new_website_chal_data.category or 'dunno') != (old_data.category or 'dunno'):
+            return True
         
         return False # Not pending if all checked fields are the same
     
     @staticmethod
     def get_filename_from_url(url: str):
+        return get_filename_from_url(url)
+
+    def get_challenge_base_path(self, platform_key, chal: ChallengeSummary):
+        # Folder of a challenge in the state
+        if getattr(chal, 'folder', None):
+            return os.path.join(self.challenges_directory, chal.folder)
+        
+        # Not tracked yet (older state files): where it would be with its current name
+        challenge_name = chal.name or f"challenge_{chal.id}"
+        safe_challenge_name = self.get_safe_challenge_name(challenge_name, chal.id)
+        return self._get_platform_challenge_base_path(platform_key, chal.category or 'dunno', safe_challenge_name)
+
+    def _relocate_challenge_folder(self, platform_key, old_chal: ChallengeDetails, new_path: str, log_fields: dict):
+        # Move the folder of a renamed (or moved to another category) challenge instead of downloading everything again
+        if old_chal is None:
+            return
+        old_path = self.get_challenge_base_path(platform_key, old_chal)
+        if os.path.normpath(old_path) == os.path.normpath(new_path) or not os.path.isdir(old_path):
+            return
+        if os.path.exists(new_path):
+            logger.warning(f"\tCannot move '{old_path}' to '{new_path}': destination already exists.", extra=log_fields)
+            return
+        
+        try:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.rename(old_path, new_path)
+            logger.info(f"\tMoved '{old_path}' to '{new_path}'", extra=log_fields)
+        except OSError as e:
+            logger.error(f"\tError moving '{old_path}' to '{new_path}': {e}", extra=log_fields)
+            return
+        
+        # Remove the old category folder if it's now empty
+        try:
+            os.rmdir(os.path.dirname(old_path))
+        except OSError:
+            pass
+
+    def _index_challenge(self, platform_key, chal: ChallengeDetails):
+        if self.search_index is None or chal is None:
+            return
+        folder = os.path.relpath(self.get_challenge_base_path(platform_key, chal), self.challenges_directory)
         try:
-            path = urlparse(url).path
-            filename = os.path.basename(path)
-            return unquote(filename)
-        except Exception:
-            # fallback if URL is malformed or unexpected
-            return "unknown_file"
-
-    def update(self, all_challenges: list, connectors_map: dict, selected_category_filter: str):
+            self.search_index.upsert(chal, folder)
+        except sqlite3.Error as e:
+            logger.error(f"Error updating the search index for [{platform_key}] {chal.name}: {e}")
+
+    def rebuild_search_index(self):
+        def challenges_with_folders():
+            for platform_key, platform_challenges in self.state.items():
+                for chal in platform_challenges.values():
+                    if chal.platform is None:
+                        chal.platform = platform_key
+                    yield chal, os.path.relpath(self.get_challenge_base_path(platform_key, chal), self.challenges_directory)
+        self.search_index.rebuild(challenges_with_folders())
+
+    def _collect_attachment_results(self, wait = False):
+        if self.attachment_pipeline is not None:
+            self.attachment_pipeline.collect(wait)
+
+    def _checkpoint(self):
+        # Save the state every 'checkpoint_interval' seconds while updating,
+        # so an interrupted run keeps what it already downloaded
+        if self.checkpoint_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._last_checkpoint >= self.checkpoint_interval:
+            self.save_state()
+            self._last_checkpoint = now
+
+    @staticmethod
+    def get_safe_challenge_name(challenge_name: str, challenge_id):
+        # Remove spaces and weird chars from challenge_name
+        safe_challenge_name = "".join(c if c.isalnum() or c in ('_', '-') else '' for c in challenge_name.replace(' ', '_')).strip()
+        if not safe_challenge_name: safe_challenge_name = f"challenge_{challenge_id}"
+        return safe_challenge_name
+
+    def is_selected(self, chal: ChallengeSummary, selector: ChallengeSelector = None):
+        # Checked against the state before the update, no requests
+        if selector is None:
+            return True
+        return selector.matches(chal, self.get_challenge_from_state(chal.platform, chal.id))
+
+    def update(self, all_challenges: list, connectors_map: dict, selected_category_filter: str, scheduler: UpdateScheduler = None, budgets: dict = None, account_connectors: dict = None, selector: ChallengeSelector = None):
+        # account_connectors: {platform_key: {account_name: connector}}, every account of a platform (main one included).
+        # Challenge details and attachments are downloaded once with connectors_map, only the solve status is per account.
+        # Pending challenges not matched by 'selector' keep their old state (still pending) and cost no requests
         if selected_category_filter is None: # User chose to update nothing
-            print("No category selected for update. Skipping challenge processing.")
+            logger.info("No category selected for update. Skipping challenge processing.")
+            self.record_new_challenges(all_challenges)
             return
+        
+        if scheduler is None:
+            scheduler = UpdateScheduler()
+        if budgets is None:
+            budgets = {}
+        if account_connectors is None:
+            account_connectors = {}
 
         next_global_state = {}
 
         for chal_data_from_web in all_challenges:
-            platform_key = chal_data_from_web['platform']
+            platform_key = chal_data_from_web.platform
             if platform_key not in next_global_state:
-                next_global_state[platform_key] = []
+                next_global_state[platform_key] = {}
         
         # Keep old plaform
         for p_key in self.state:
             if p_key not in next_global_state:
-                next_global_state[p_key] = list(self.state[p_key]) # copy old state for that platform
-
+                next_global_state[p_key] = dict(self.state[p_key]) # copy old state for that platform
 
+        now = int(time.time())
+        challenges_to_process = []
         for chal_data_from_web in all_challenges:
-            platform_key = chal_data_from_web['platform']
-            challenge_id = chal_data_from_web['id']
-            category_name = chal_data_from_web.get('category', 'dunno')
-            challenge_name = chal_data_from_web.get('name', f"challenge_{challenge_id}")
-
-            # Remove spaces and weird chars from challenge_name
-            safe_challenge_name = "".join(c if c.isalnum() or c in ('_', '-') else '' for c in challenge_name.replace(' ', '_')).strip()
-            if not safe_challenge_name: safe_challenge_name = f"challenge_{challenge_id}"
-
+            platform_key = chal_data_from_web.platform
+            challenge_id = chal_data_from_web.id
+            category_name = chal_data_from_web.category or 'dunno'
             current_platform_category_key = f"{platform_key}/{category_name}"
             
             # Determine if this specific challenge should be processed
-            should_process_this_challenge = False
-            if chal_data_from_web.get('pending', False): # 'pending' is pre-set by main.py
+            if chal_data_from_web.pending and self.is_selected(chal_data_from_web, selector): # 'pending' is pre-set by main.py
                 if not selected_category_filter: # Empty string means update all pending
-                    should_process_this_challenge = True
+                    challenges_to_process.append(chal_data_from_web)
                 elif current_platform_category_key == selected_category_filter:
-                    should_process_this_challenge = True
+                    challenges_to_process.append(chal_data_from_web)
             
-            if should_process_this_challenge:
-                print(f"\nProcessing update for: [{platform_key}] {safe_challenge_name} (Category: {category_name})")
+            # Until it's processed, a challenge keeps its old state (marked as pending)
+            old_state_for_this_chal = self.get_challenge_from_state(platform_key, challenge_id)
+            if old_state_for_this_chal:
+                if chal_data_from_web.pending:
+                     old_state_for_this_chal.pending = True
+                next_global_state[platform_key][challenge_id] = old_state_for_this_chal
+            else:
+                new_chal = ChallengeDetails.from_summary(chal_data_from_web)
+                new_chal.first_seen = now
+                next_global_state[platform_key][challenge_id] = new_chal
+        
+        # Order before replacing the state, the scheduler needs to know which challenges are new
+        challenges_to_process = scheduler.order(challenges_to_process, self)
+        self.state = next_global_state # Replace the entire state with the newly built one
+        
+        # Each challenge goes into the state as soon as it's done
+        self._last_checkpoint = time.monotonic()
+        for chal_data_from_web in progress(challenges_to_process, desc='Updating challenges', unit='chal'):
+            connector = connectors_map.get(chal_data_from_web.platform)
+            budget = budgets.get(chal_data_from_web.platform)
+            accounts = account_connectors.get(chal_data_from_web.platform, {})
+            first_seen = self.state[chal_data_from_web.platform][chal_data_from_web.id].first_seen
+            updated_chal = self._process_challenge(chal_data_from_web, connector, scheduler, budget, accounts)
+            updated_chal.first_seen = first_seen
+            self.state[chal_data_from_web.platform][chal_data_from_web.id] = updated_chal
+            self._index_challenge(chal_data_from_web.platform, updated_chal)
+            self._collect_attachment_results()
+            self._checkpoint()
+        
+        self._collect_attachment_results(wait=True)
+
+    def _process_challenge(self, chal_data_from_web: ChallengeSummary, connector, scheduler: UpdateScheduler, budget: DownloadBudget = None, accounts: dict = None):
+        # Download everything about a challenge, return its new state
+        platform_key = chal_data_from_web.platform
+        challenge_id = chal_data_from_web.id
+        category_name = chal_data_from_web.category or 'dunno'
+        challenge_name = chal_data_from_web.name or f"challenge_{challenge_id}"
+        safe_challenge_name = self.get_safe_challenge_name(challenge_name, challenge_id)
+        
+        log_fields = {'platform': platform_key, 'challenge_id': challenge_id, 'challenge': safe_challenge_name}
+        logger.info(f"Processing update for: [{platform_key}] {safe_challenge_name} (Category: {category_name})", extra=log_fields)
+        
+        if not connector:
+            logger.warning(f"\tNo active connector found for platform '{platform_key}'. Skipping API calls for this challenge.", extra=log_fields)
+            return self.get_challenge_from_state(platform_key, challenge_id)
+
+        challenge_base_fs_path = self._get_platform_challenge_base_path(platform_key, category_name, safe_challenge_name)
+        challenge_files_subfolder_path = os.path.join(challenge_base_fs_path, 'challenge') # For attachments
+        challenge_folder = os.path.relpath(challenge_base_fs_path, self.challenges_directory)
+        
+        # Folders are tracked by (platform, id): a renamed or moved challenge keeps its files
+        old_state_for_chal = self.get_challenge_from_state(platform_key, challenge_id)
+        self._relocate_challenge_folder(platform_key, old_state_for_chal, challenge_base_fs_path, log_fields)
+
+        # Create directories
+        newly_created_challenge_files_subfolder = False
+        if not os.path.exists(challenge_files_subfolder_path):
+            os.makedirs(challenge_files_subfolder_path, exist_ok=True)
+            logger.debug(f"\tCreated directory: {challenge_files_subfolder_path}", extra=log_fields)
+            newly_created_challenge_files_subfolder = True # Download files if this dir is new
+
+        logger.debug(f"\tFetching detailed info for '{safe_challenge_name}' from '{platform_key}'...", extra=log_fields)
+        # Use the specific connector for this platform
+        detailed_chal_data, solvers_list = connector.get_challenge_details(challenge_id)
+        
+        if not detailed_chal_data:
+            logger.warning(f"\tFailed to fetch detailed info for '{safe_challenge_name}'. It might be partially updated or skipped.", extra=log_fields)
+            if old_state_for_chal:
+                # Keep what earlier runs found (deferred files, files to download again, solve status)
+                failed_chal = ChallengeDetails.from_dict(old_state_for_chal.to_dict())
+            else:
+                failed_chal = ChallengeDetails.from_summary(chal_data_from_web)
+            failed_chal.pending = True # Failed to get details, still pending
+            failed_chal.folder = challenge_folder
+            return failed_chal
+        
+        # Some platforms don't send the category with the details
+        if detailed_chal_data.category is None:
+            detailed_chal_data.category = category_name
+        
+        # Solve status of each account, only per-user requests are repeated
+        for account_name, account_connector in (accounts or {}).items():
+            if account_connector is connector:
+                detailed_chal_data.solved_by[account_name] = bool(detailed_chal_data.solved_by_me)
+            else:
+                detailed_chal_data.solved_by[account_name] = account_connector.is_solved_by_me(detailed_chal_data, solvers_list)
+        
+        # Update files based on detailed_chal_data
+        # 1. general_info.md
+        md_path = os.path.join(challenge_base_fs_path, 'general_info.md')
+        logger.debug(f"\tWriting '{md_path}'", extra=log_fields)
+        try:
+            with open(md_path, 'w', encoding='utf-8') as f:
+                f.write(f"# ({detailed_chal_data.id}) {detailed_chal_data.name or challenge_name}\n")
+                f.write(f"- Platform: {platform_key}\n")
+                f.write(f"- Category: {detailed_chal_data.category}\n")
+                f.write(f"- {detailed_chal_data.value if detailed_chal_data.value is not None else 'N/A'} points\n")
+                solved_status = 'Solved' if detailed_chal_data.solved_by_me else 'Not Solved'
+                f.write(f"- Status: {solved_status}\n")
+                if len(detailed_chal_data.solved_by) > 1:
+                    accounts_status = ', '.join(f"{account_name} ({'Solved' if solved else 'Not Solved'})" for account_name, solved in detailed_chal_data.solved_by.items())
+                    f.write(f"- Accounts: {accounts_status}\n")
+                f.write("\n")
+                f.write(f"## Description:\n{detailed_chal_data.description or 'No description provided.'}")
+        except Exception as e:
+            logger.error(f"\tError writing general_info.md for {safe_challenge_name}: {e}", extra=log_fields)
                 
-                connector = connectors_map.get(platform_key)
-                if not connector:
-                    print(f"\tWarning: No active connector found for platform '{platform_key}'. Skipping API calls for this challenge.")
-                    current_state_for_chal = self.get_challenge_from_state(platform_key, challenge_id)
-                    if current_state_for_chal:
-                         next_global_state[platform_key].append(current_state_for_chal)
-                    else:
-                        chal_data_from_web['pending'] = True # Still pending
-                        next_global_state[platform_key].append(chal_data_from_web)
-                    continue
+        # 2. Download attachments (before the solvers list, they are what we need first)
+        problem_with_download = False
+        retry_download = old_state_for_chal.need_download_again if old_state_for_chal else False
+        # Files deferred by an earlier run stay deferred until they are downloaded
+        deferred_files = list(old_state_for_chal.deferred_files) if old_state_for_chal else []
+        
+        if detailed_chal_data.files and (newly_created_challenge_files_subfolder or retry_download):
+            logger.debug(f"\tDownloading attachments for '{safe_challenge_name}'...", extra=log_fields)
+            attachments = scheduler.order_attachments(detailed_chal_data.files, connector)
+            problem_with_download, deferred_files = self._download_attachments(attachments, connector, challenge_files_subfolder_path, budget)
+        elif old_state_for_chal:
+            self._keep_attachment_results(detailed_chal_data.files, old_state_for_chal.files)
 
-                challenge_base_fs_path = self._get_platform_challenge_base_path(platform_key, category_name, safe_challenge_name)
-                challenge_files_subfolder_path = os.path.join(challenge_base_fs_path, 'challenge') # For attachments
+        # 3. solvers.txt
+        solvers_path = os.path.join(challenge_base_fs_path, 'solvers.txt')
+        logger.debug(f"\tWriting '{solvers_path}'", extra=log_fields)
+        try:
+            with open(solvers_path, 'w', encoding='utf-8') as f:
+                f.write(f"{detailed_chal_data.solves or 0} people solved this:\n")
+                for solver_name in solvers_list: # solvers_list should be a list of names
+                    f.write(f"\t- {solver_name}\n")
+        except Exception as e:
+            logger.error(f"\tError writing solvers.txt for {safe_challenge_name}: {e}", extra=log_fields)
+        
+        # Update
+        final_chal_data_for_state = detailed_chal_data
+        final_chal_data_for_state.platform = platform_key 
+        final_chal_data_for_state.pending = problem_with_download # If some problem happend during download, mark that as pending
+        final_chal_data_for_state.need_download_again = problem_with_download
+        final_chal_data_for_state.deferred_files = deferred_files
+        final_chal_data_for_state.folder = challenge_folder
+        return final_chal_data_for_state
 
-                # Create directories
-                newly_created_challenge_files_subfolder = False
-                if not os.path.exists(challenge_files_subfolder_path):
-                    os.makedirs(challenge_files_subfolder_path, exist_ok=True)
-                    print(f"\tCreated directory: {challenge_files_subfolder_path}")
-                    newly_created_challenge_files_subfolder = True # Download files if this dir is new
+    @staticmethod
+    def _keep_attachment_results(new_files: list, old_files: list):
+        # Files already on disk are not downloaded (nor classified and extracted) again:
+        # the fresh attachments from the details keep what was found about them
+        old_by_url = {f.url: f for f in old_files}
+        old_by_name = {f.name: f for f in old_files}
+        for attachment in new_files:
+            old_attachment = old_by_url.get(attachment.url) or old_by_name.get(attachment.name)
+            if old_attachment is None:
+                continue
+            if attachment.size is None:
+                attachment.size = old_attachment.size
+            if attachment.file_type is None:
+                attachment.file_type = old_attachment.file_type
+            if not attachment.extracted:
+                attachment.extracted = old_attachment.extracted
 
-                print(f"\tFetching detailed info for '{safe_challenge_name}' from '{platform_key}'...")
-                # Use the specific connector for this platform
-                detailed_chal_data, solvers_list = connector.get_challenge_details(challenge_id)
+    def _download_attachments(self, attachments: list, connector, challenge_files_subfolder_path: str, budget: DownloadBudget = None, ignore_file_size = False):
+        # Download the attachments into the challenge folder.
+        # Return (problem_with_download, files deferred because of the budget)
+        problem_with_download = False
+        deferred_files = []
+        
+        for attachment in progress(attachments, desc='Attachments', unit='file'):
+            attachment_name = attachment.name
+            if not attachment_name or attachment_name == "unknown_file": # Skip if filename is problematic
+                 logger.warning(f"\t\tCould not determine filename from URL: {attachment.url}. Skipping.")
+                 continue
+            
+            if budget is not None and budget.has_limits():
+                if attachment.size is None:
+                    attachment.size = connector.get_attachment_size(attachment.url)
                 
-                if not detailed_chal_data:
-                    print(f"\tWarning: Failed to fetch detailed info for '{safe_challenge_name}'. It might be partially updated or skipped.")
-                    chal_data_from_web['pending'] = True # Failed to get details, still pending
-                    next_global_state[platform_key].append(chal_data_from_web)
+                skip_reason = budget.check(attachment.size, challenge_files_subfolder_path, ignore_file_size)
+                if skip_reason:
+                    logger.info(f"\t\tDeferring '{attachment_name}': {skip_reason}.", extra={'attachment': attachment_name, 'size': attachment.size})
+                    deferred_files.append(attachment)
                     continue
-                
-                # Update files based on detailed_chal_data
-                # 1. general_info.md
-                md_path = os.path.join(challenge_base_fs_path, 'general_info.md')
-                print(f"\tWriting '{md_path}'")
-                try:
-                    with open(md_path, 'w', encoding='utf-8') as f:
-                        f.write(f"# ({detailed_chal_data.get('id', challenge_id)}) {detailed_chal_data.get('name', challenge_name)}\n")
-                        f.write(f"- Platform: {platform_key}\n")
-                        f.write(f"- Category: {detailed_chal_data.get('category', category_name)}\n")
-                        f.write(f"- {detailed_chal_data.get('value', 'N/A')} points\n")
-                        solved_status = 'Solved' if detailed_chal_data.get('solved_by_me') else 'Not Solved'
-                        f.write(f"- Status: {solved_status}\n\n")
-                        f.write(f"## Description:\n{detailed_chal_data.get('description', 'No description provided.')}")
-                except Exception as e:
-                    print(f"\tError writing general_info.md for {safe_challenge_name}: {e}")
 
-                # 2. solvers.txt
-                solvers_path = os.path.join(challenge_base_fs_path, 'solvers.txt')
-                print(f"\tWriting '{solvers_path}'")
+            logger.debug(f"\t\tDownloading '{attachment_name}'...", extra={'attachment': attachment_name, 'size': attachment.size})
+            default_throttle = connector.download_throttle
+            if budget is not None:
+                # The limits are also checked while the file downloads, in case its size was unknown or wrong
+                connector.download_throttle = budget.limit_download(ignore_file_size)
+            try:
+                file_content = connector.download_attachment(attachment.url)
+            except BudgetExceededError as e:
+                budget.consume(e.downloaded_bytes)
+                logger.info(f"\t\tDeferring '{attachment_name}' after {format_size(e.downloaded_bytes)}: {e}.", extra={'attachment': attachment_name, 'size': attachment.size})
+                deferred_files.append(attachment)
+                continue
+            finally:
+                connector.download_throttle = default_throttle
+            
+            if file_content is not None:
+                attachment.size = len(file_content)
+                if budget is not None:
+                    budget.consume(attachment.size)
+                attachment_save_path = os.path.join(challenge_files_subfolder_path, attachment_name)
                 try:
-                    with open(solvers_path, 'w', encoding='utf-8') as f:
-                        f.write(f"{detailed_chal_data.get('solves', 0)} people solved this:\n")
-                        for solver_name in solvers_list: # solvers_list should be a list of names
-                            f.write(f"\t- {solver_name}\n")
+                    with open(attachment_save_path, 'wb') as f:                        
+                        f.write(file_content)
+                    logger.debug(f"\t\tSaved '{attachment_name}' to '{attachment_save_path}'", extra={'attachment': attachment_name, 'size': attachment.size})
+                    if self.attachment_pipeline is not None:
+                        self.attachment_pipeline.submit(attachment, attachment_save_path)
                 except Exception as e:
-                    print(f"\tError writing solvers.txt for {safe_challenge_name}: {e}")
-                        
-                # 3. Download attachments
-                problem_with_download = False
-                retry_download = self.get_challenge_from_state(platform_key, detailed_chal_data.get('id', challenge_id)).get('need_download_again', False)
+                    logger.error(f"\t\tError saving file {attachment_name}: {e}", extra={'attachment': attachment_name})
+            else:
+                logger.warning(f"\t\tFailed to download '{attachment_name}'.", extra={'attachment': attachment_name})
+                problem_with_download = True
+        
+        return problem_with_download, deferred_files
+
+    def download_deferred(self, connectors_map: dict, budgets: dict = None):
+        # Download the attachments deferred by earlier runs (e.g. during off-peak hours).
+        # The file size limit is ignored, the other limits still apply
+        if budgets is None:
+            budgets = {}
+        
+        for platform_key, platform_challenges in self.state.items():
+            connector = connectors_map.get(platform_key)
+            for chal in platform_challenges.values():
+                if not chal.deferred_files:
+                    continue
+                if not connector:
+                    logger.warning(f"No active connector found for platform '{platform_key}'. Skipping deferred downloads.")
+                    break
                 
-                if detailed_chal_data.get('files') and (newly_created_challenge_files_subfolder or retry_download):
-                    print(f"\tDownloading attachments for '{safe_challenge_name}'...")
-                    for file_relative_url in detailed_chal_data['files']: # Assuming 'files' is a list of relative URLs
-                        attachment_name = ChallengeStateManager.get_filename_from_url(file_relative_url)
-                        if not attachment_name or attachment_name == "unknown_file": # Skip if filename is problematic
-                             print(f"\t\tCould not determine filename from URL: {file_relative_url}. Skipping.")
-                             continue
-
-                        print(f"\t\tDownloading '{attachment_name}'...")
-                        file_content = connector.download_attachment(file_relative_url)
-                        
-                        if file_content is not None:
-                            attachment_save_path = os.path.join(challenge_files_subfolder_path, attachment_name)
-                            try:
-                                with open(attachment_save_path, 'wb') as f:                        
-                                    f.write(file_content)
-                                print(f"\t\tSaved '{attachment_name}' to '{attachment_save_path}'")
-                            except Exception as e:
-                                print(f"\t\tError saving file {attachment_name}: {e}")
-                        else:
-                            print(f"\t\tFailed to download '{attachment_name}'.")
-                            problem_with_download = True
+                challenge_base_fs_path = self.get_challenge_base_path(platform_key, chal)
+                safe_challenge_name = os.path.basename(challenge_base_fs_path)
+                challenge_files_subfolder_path = os.path.join(challenge_base_fs_path, 'challenge')
+                os.makedirs(challenge_files_subfolder_path, exist_ok=True)
                 
-                # Update
-                final_chal_data_for_state = dict(detailed_chal_data)
-                final_chal_data_for_state['platform'] = platform_key 
-                final_chal_data_for_state['pending'] = problem_with_download # If some problem happend during download, mark that as pending
-                final_chal_data_for_state['need_download_again'] = problem_with_download
-                next_global_state[platform_key].append(final_chal_data_for_state)
-
-            else: # Challenge was not selected for processing or wasn't pending
-                old_state_for_this_chal = self.get_challenge_from_state(platform_key, challenge_id)
-                if old_state_for_this_chal:
-                    if 'pending' in chal_data_from_web and chal_data_from_web['pending']:
-                         old_state_for_this_chal['pending'] = True
-                    next_global_state[platform_key].append(old_state_for_this_chal)
-                else:
-                    next_global_state[platform_key].append(chal_data_from_web)
-        
-        self.state = next_global_state # Replace the entire state with the newly built one
\ No newline at end of file
+                logger.info(f"Downloading deferred attachments for: [{platform_key}] {safe_challenge_name}", extra={'platform': platform_key, 'challenge_id': chal.id, 'challenge': safe_challenge_name})
+                # Use the attachments of the challenge, so they get the results of the attachment pipeline
+                files_by_url = {attachment.url: attachment for attachment in chal.files}
+                attachments = [files_by_url.get(attachment.url, attachment) for attachment in chal.deferred_files]
+                problem_with_download, deferred_files = self._download_attachments(
+                    attachments, connector, challenge_files_subfolder_path, budgets.get(platform_key), ignore_file_size=True
+                )
+                
+                if problem_with_download:
+                    # Download them again with the next update
+                    chal.need_download_again = True
+                    chal.pending = True
+                chal.deferred_files = deferred_files
+                self._collect_attachment_results()
+                self._checkpoint()
+        
+        self._collect_attachment_results(wait=True)
@@ -0,0 +1,130 @@
+import shutil
+import time
+
+BUDGET_OPTIONS = ['max_run_bytes', 'max_file_bytes', 'max_bytes_per_second', 'min_free_disk_bytes']
+
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+def parse_size(size_string: str):
+    # "500", "200KB", "1.5 GB" -> bytes. Empty string means no limit (None)
+    size_string = size_string.strip().upper()
+    if not size_string:
+        return None
+
+    number = size_string.rstrip('KMGB ')
+    unit = size_string[len(number):].strip()
+    if unit not in _SIZE_UNITS:
+        raise ValueError(f"Unknown size unit in '{size_string}'")
+    try:
+        size = float(number)
+    except ValueError:
+        raise ValueError(f"Invalid size '{size_string}'")
+    if size < 0:
+        raise ValueError(f"Negative size '{size_string}'")
+    return int(size * _SIZE_UNITS[unit])
+
+def format_size(size: int):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+class BudgetExceededError(Exception):
+    # Raised while a file is downloading, as soon as it goes over a limit
+    def __init__(self, reason: str, downloaded_bytes: int):
+        super().__init__(reason)
+        self.downloaded_bytes = downloaded_bytes
+
+class DownloadBudget:
+    # Limits for the attachment downloads of a run, None means no limit.
+    # A platform budget has the global budget as parent: a file must fit in both
+    def __init__(self, max_run_bytes=None, max_file_bytes=None, max_bytes_per_second=None, min_free_disk_bytes=None, parent=None):
+        self.max_run_bytes = max_run_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_bytes_per_second = max_bytes_per_second
+        self.min_free_disk_bytes = min_free_disk_bytes
+        self.parent = parent
+
+        self.used_bytes = 0
+        self._next_send_time = time.monotonic()
+
+    @classmethod
+    def from_config(cls, config, section: str, parent=None):
+        options = {}
+        for option in BUDGET_OPTIONS:
+            options[option] = parse_size(config.get(section, option, fallback=''))
+        return cls(parent=parent, **options)
+
+    def has_limits(self):
+        budget = self
+        while budget is not None:
+            if any(getattr(budget, option) is not None for option in BUDGET_OPTIONS):
+                return True
+            budget = budget.parent
+        return False
+
+    def check_size(self, size, ignore_file_size = False):
+        # Why a file of 'size' bytes (None if unknown) goes over the file or run limit, None if it doesn't
+        budget = self
+        while budget is not None:
+            if size is not None and budget.max_file_bytes is not None and not ignore_file_size:
+                if size > budget.max_file_bytes:
+                    return f"larger than the {format_size(budget.max_file_bytes)} file limit"
+
+            if budget.max_run_bytes is not None:
+                if budget.used_bytes + (size or 0) > budget.max_run_bytes or budget.used_bytes >= budget.max_run_bytes:
+                    return f"over the {format_size(budget.max_run_bytes)} budget for this run"
+
+            budget = budget.parent
+        return None
+
+    def check(self, size, directory, ignore_file_size = False):
+        # Why a file of 'size' bytes (None if unknown) can't be downloaded in 'directory' now.
+        # None if it can
+        reason = self.check_size(size, ignore_file_size)
+        if reason:
+            return reason
+
+        budget = self
+        while budget is not None:
+            if budget.min_free_disk_bytes is not None:
+                free_bytes = shutil.disk_usage(directory).free
+                if free_bytes - (size or 0) < budget.min_free_disk_bytes:
+                    return f"only {format_size(free_bytes)} of free disk space"
+
+            budget = budget.parent
+        return None
+
+    def consume(self, size: int):
+        budget = self
+        while budget is not None:
+            budget.used_bytes += size
+            budget = budget.parent
+
+    def throttle(self, size: int):
+        # Called for every downloaded chunk, sleeps to stay under max_bytes_per_second
+        budget = self
+        while budget is not None:
+            if budget.max_bytes_per_second:
+                now = time.monotonic()
+                budget._next_send_time = max(budget._next_send_time, now) + size / budget.max_bytes_per_second
+                wait = budget._next_send_time - now - 1 # Allow a burst of one second
+                if wait > 0:
+                    time.sleep(wait)
+            budget = budget.parent
+
+    def limit_download(self, ignore_file_size = False):
+        # Chunk callback for one file (connector.download_throttle): throttles, and raises BudgetExceededError
+        # once the bytes received go over the file or run limit. The size told by HEAD can be missing or wrong
+        downloaded_bytes = 0
+
+        def on_chunk(size: int):
+            nonlocal downloaded_bytes
+            downloaded_bytes += size
+            reason = self.check_size(downloaded_bytes, ignore_file_size)
+            if reason:
+                raise BudgetExceededError(reason, downloaded_bytes)
+            self.throttle(size)
+
+        return on_chunk
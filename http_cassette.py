@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from download_budget import format_size
+
+logger = logging.getLogger(__name__)
+
+# A cassette is a folder:
+#   index.jsonl         one line per response, in the order they were received
+#   blobs/ab/abcd....gz the bodies, gzipped and named by the sha256 of their content (saved once)
+_INDEX_FILE_NAME = 'index.jsonl'
+_BLOBS_DIR_NAME = 'blobs'
+
+# The stored body is already decoded, these headers would describe the original one
+_DROPPED_HEADERS = {'content-encoding', 'transfer-encoding'}
+
+class UnmatchedRequestError(requests.exceptions.ConnectionError):
+    # Replay: the request is not in the cassette. Connectors handle it like a network error
+    pass
+
+def get_request_body_hash(request: requests.PreparedRequest):
+    # Requests with the same method and URL (e.g. two logins) are told apart by their body.
+    # Only the hash is saved, so passwords don't end up in the cassette
+    body = request.body
+    if body is None:
+        body = b''
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+    elif not isinstance(body, bytes): # Streamed upload, not used by the connectors
+        return None
+    return hashlib.sha256(body).hexdigest()
+
+class RecordingAdapter(HTTPAdapter):
+    # Real requests, every response is also saved in the cassette
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        content = response.content # Read the whole body, it is still readable with iter_content
+        self.cassette.add(request, response, content)
+        return response
+
+class ReplayAdapter(HTTPAdapter):
+    # No network (send never calls the real adapter): responses come from the cassette
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.cassette.next_response(request)
+        if entry is None:
+            logger.debug(f"No recorded response for {request.method} {request.url}")
+            raise UnmatchedRequestError(f"No recorded response for {request.method} {request.url}", request=request)
+
+        # The body is decompressed from disk while it is read, so streamed downloads stay streamed
+        raw = HTTPResponse(
+            body=self.cassette.open_blob(entry['body']), headers=entry['headers'], status=entry['status'],
+            reason=entry['reason'], request_method=request.method, preload_content=False, decode_content=False
+        )
+        return self.build_response(request, raw)
+
+class HttpCassette:
+    # Record the HTTP traffic of a run to a folder, or replay it with no network.
+    # mode is 'record' or 'replay'.
+    # Requests are matched by method, URL and body hash. The same request sent again gets the next
+    # recorded response, the last one is reused when they are over
+    def __init__(self, path: str, mode: str):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.blobs_dir = os.path.join(path, _BLOBS_DIR_NAME)
+
+        self._responses = defaultdict(list) # {(method, url, body hash): [entry]}
+        self._replayed = defaultdict(int) # {(method, url, body hash): responses used}
+        self._index_file = None
+        self.recorded_count = 0
+        self.recorded_bytes = 0
+
+        if mode == 'record':
+            os.makedirs(self.blobs_dir, exist_ok=True)
+            self._index_file = open(os.path.join(path, _INDEX_FILE_NAME), 'w', encoding='utf-8')
+        else:
+            with open(os.path.join(path, _INDEX_FILE_NAME), 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._responses[(entry['method'], entry['url'], entry['request_body'])].append(entry)
+
+    def attach(self, session: requests.Session):
+        adapter = RecordingAdapter(self) if self.mode == 'record' else ReplayAdapter(self)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    def _get_blob_path(self, digest: str):
+        return os.path.join(self.blobs_dir, digest[:2], digest + '.gz')
+
+    def open_blob(self, digest: str):
+        return gzip.open(self._get_blob_path(digest), 'rb')
+
+    def _save_blob(self, content: bytes):
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._get_blob_path(digest)
+        if not os.path.exists(blob_path): # Same file downloaded again, or the same page for another account
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temp_path = blob_path + '.tmp'
+            with gzip.open(temp_path, 'wb', compresslevel=6) as f:
+                f.write(content)
+            os.replace(temp_path, blob_path)
+            self.recorded_bytes += os.path.getsize(blob_path)
+        return digest
+
+    def add(self, request: requests.PreparedRequest, response: requests.Response, content: bytes):
+        headers = {key: value for key, value in response.headers.items() if key.lower() not in _DROPPED_HEADERS}
+        if request.method != 'HEAD': # HEAD keeps the real size of the file
+            headers = {key: value for key, value in headers.items() if key.lower() != 'content-length'}
+            headers['Content-Length'] = str(len(content))
+
+        entry = {
+            'method': request.method,
+            'url': request.url,
+            'request_body': get_request_body_hash(request),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': headers,
+            'body': self._save_blob(content),
+        }
+        self._index_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.recorded_count += 1
+
+    def next_response(self, request: requests.PreparedRequest):
+        # None if the request was not recorded
+        key = (request.method, request.url, get_request_body_hash(request))
+        entries = self._responses.get(key)
+        if not entries:
+            return None
+        position = min(self._replayed[key], len(entries) - 1)
+        self._replayed[key] += 1
+        return entries[position]
+
+    def close(self):
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+            logger.info(f"Recorded {self.recorded_count} HTTP responses to '{self.path}' ({format_size(self.recorded_bytes)} of compressed bodies)")
+        elif self.mode == 'replay':
+            unused_count = sum(max(0, len(entries) - self._replayed[key]) for key, entries in self._responses.items())
+            if unused_count:
+                logger.info(f"{unused_count} recorded HTTP responses were not requested in this run")
@@ -0,0 +1,92 @@
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+from tqdm import tqdm
+
+# LogRecord attributes that are not structured fields (extra=...)
+_STANDARD_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+class TqdmConsoleHandler(logging.Handler):
+    # Print through tqdm, so log lines don't break the progress bars
+    def emit(self, record):
+        try:
+            tqdm.write(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+class ConsoleFormatter(logging.Formatter):
+    # Info and debug lines are printed as they are, the others with their level
+    def format(self, record):
+        message = super().format(record)
+        if record.levelno >= logging.WARNING:
+            return f"{record.levelname}: {message}"
+        return message
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, with the structured fields passed in extra=...
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_listener = None
+
+def setup_logging(level='INFO', json_log_file=None):
+    # Log records are put in a queue by the caller thread and written by a background thread.
+    # Call shutdown_logging() before exiting, to write everything still in the queue
+    global _listener
+    shutdown_logging()
+
+    console_handler = TqdmConsoleHandler()
+    console_handler.setFormatter(ConsoleFormatter('%(message)s'))
+    handlers = [console_handler]
+
+    if json_log_file:
+        json_handler = logging.FileHandler(json_log_file, encoding='utf-8')
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+    # Connection details from urllib3 are just noise
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def flush_logs():
+    # Wait until every queued record is written (e.g. before asking something to the user)
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def progress(iterable=None, **kwargs):
+    # Progress bar, hidden when the output is not a terminal
+    kwargs.setdefault('leave', False)
+    kwargs.setdefault('disable', None)
+    return tqdm(iterable, **kwargs)
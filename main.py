@@ -1,24 +1,51 @@
 import os
+import argparse
 import configparser
 import importlib # For dynamically importing modules
+import logging
+import time
 from collections import defaultdict
 
+from challenge_record import ChallengeSummary
 from challenge_state_manager import ChallengeStateManager
+from update_scheduler import UpdateScheduler, DEFAULT_PRIORITY
+from download_budget import DownloadBudget, parse_size
+from logging_setup import setup_logging, flush_logs, shutdown_logging
+from search_index import SearchIndex
+from attachment_pipeline import AttachmentPipeline
+from score_history import ScoreHistory
+from http_cassette import HttpCassette
+from profiling import RunProfiler
+from challenge_selector import ChallengeSelector
+from website_connectors.base_website import IncompleteListError
 
-def get_pending_categories(state_manager: ChallengeStateManager, all_challenges: list[dict]):
-    pending_categories = defaultdict(int)
+logger = logging.getLogger(__name__)
+
+def get_pending_categories(state_manager: ChallengeStateManager, all_challenges, pending_categories: dict = None, selector: ChallengeSelector = None):
+    # 'all_challenges' can be any iterable (e.g. a connector still streaming the list),
+    # counts are accumulated into 'pending_categories' if given.
+    # Only the challenges matched by 'selector' are counted
+    if pending_categories is None:
+        pending_categories = defaultdict(int)
     
     for chal in all_challenges:
-        platform = chal.get('platform', 'unknown_platform')
-        category = chal.get('category', 'dunno')
+        platform = chal.platform or 'unknown_platform'
+        category = chal.category or 'dunno'
         platform_category_key = f"{platform}/{category}"
         
-        chal['pending'] = state_manager.is_pending(chal)
-        if chal['pending']:
+        chal.pending = state_manager.is_pending(chal)
+        if chal.pending and state_manager.is_selected(chal, selector):
             pending_categories[platform_category_key] += 1
             
     return pending_categories
 
+def tag_challenges(platform_key: str, challenges, collected: list[ChallengeSummary]):
+    # Tag challenges with their platform and keep them in 'collected', one at a time
+    for chal in challenges:
+        chal.platform = platform_key
+        collected.append(chal)
+        yield chal
+
 def prompt_for_category_selection(categories_with_counts: dict):
     if not categories_with_counts:
         print('All challenges are up to date across all platforms.')
@@ -58,14 +85,115 @@ def dynamically_import_connector(class_path_string: str):
         connector_class = getattr(module, class_name)
         return connector_class
     except (ImportError, AttributeError, ValueError) as e:
-        print(f"Error importing connector class '{class_path_string}': {e}")
+        logger.error(f"Error importing connector class '{class_path_string}': {e}")
         return None
 
+def get_account_sections(config: configparser.ConfigParser, platform_key: str):
+    # Other accounts of a platform are in sections named "platform_key:account_name"
+    prefix = f"{platform_key}:"
+    return [section for section in config.sections() if section.startswith(prefix) and len(section) > len(prefix)]
+
+def login_other_accounts(config: configparser.ConfigParser, platform_key: str, ConnectorClass, base_url: str, http_cassette: HttpCassette = None):
+    # Return {account_name: logged in connector}
+    account_connectors = {}
+    for account_section in get_account_sections(config, platform_key):
+        account_name = account_section.split(':', 1)[1]
+        if not config.getboolean(account_section, 'enabled', fallback=True):
+            logger.info(f"Account '{account_name}' is disabled. Skipping.")
+            continue
+        
+        username = config.get(account_section, 'username', fallback=None)
+        password = config.get(account_section, 'password', fallback=None)
+        account_connector = ConnectorClass(base_url, username, password)
+        if http_cassette is not None:
+            http_cassette.attach(account_connector.session)
+        
+        logger.info(f"Attempting login to '{platform_key}' as '{account_name}'...")
+        if account_connector.login():
+            account_connectors[account_name] = account_connector
+        else:
+            logger.warning(f"Login failed for '{platform_key}' as '{account_name}'.")
+    return account_connectors
+
+def run_search(search_index: SearchIndex, query: str, limit: int):
+    start_time = time.perf_counter()
+    results = search_index.search(query, limit)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    
+    if not results:
+        print(f"No challenges found for '{query}' ({elapsed_ms:.1f} ms).")
+        return
+    
+    print(f"{len(results)} challenges found for '{query}' ({elapsed_ms:.1f} ms):\n")
+    for idx, result in enumerate(results, start=1):
+        value = f"{result['value']} points" if result['value'] is not None else 'N/A points'
+        print(f"{idx}. [{result['platform']}] {result['name']} (Category: {result['category']}, {value})")
+        print(f"\t{result['folder']}")
+        if result['snippet']:
+            print(f"\t{' '.join(result['snippet'].split())}")
+
+def run_trends(score_history: ScoreHistory, state_manager: ChallengeStateManager, hours: float, platform_key: str, by: str, limit: int):
+    since = int(time.time() - hours * 3600)
+    results = score_history.trending(since, platform=platform_key, by=by, limit=limit)
+    
+    what = 'new solves' if by == 'solves' else 'score drop'
+    if not results:
+        print(f"No challenges with {what} in the last {hours:g} hours.")
+        return
+    
+    print(f"Challenges by {what} in the last {hours:g} hours:\n")
+    for idx, result in enumerate(results, start=1):
+        chal = state_manager.get_challenge_from_state(result['platform'], result['id'])
+        name = chal.name if chal else f"id {result['id']}"
+        print(f"{idx}. [{result['platform']}] {name}: solves {result['solves_start']} -> {result['solves_end']} ({result['solves_delta']:+d}), "
+              f"value {result['value_start']} -> {result['value_end']} ({result['value_delta']:+d})")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Fetch and manage CTF challenges from multiple platforms.')
+    parser.add_argument('--download-deferred', action='store_true',
+                        help='Only download the attachments deferred by earlier runs (e.g. too large for the budget)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Log every file written and downloaded (log_level = DEBUG)')
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help='Update all pending challenges without asking')
+    parser.add_argument('--select', metavar='EXPR', default=None,
+                        help='Only update the pending challenges matching EXPR, e.g. "solved_by_me=false value>=200 age<30d" (overrides "select" in config.ini)')
+    parser.add_argument('--profile', nargs='?', const='profiles', default=None, metavar='DIR',
+                        help='Profile the whole run, reports are written to DIR (default: profiles)')
+    http_group = parser.add_mutually_exclusive_group()
+    http_group.add_argument('--record-http', metavar='DIR', help='Save every HTTP response of this run to the cassette folder DIR')
+    http_group.add_argument('--replay-http', metavar='DIR', help='Use the HTTP responses saved in DIR instead of the network (no network at all)')
+    
+    subparsers = parser.add_subparsers(dest='command', help='Default: sync the challenges')
+    search_parser = subparsers.add_parser('search', help='Search the names, categories and descriptions of the mirrored challenges')
+    search_parser.add_argument('query', nargs='+', help='Words to search (SQLite FTS5 syntax, e.g. "heap", "rsa*", "heap NOT kernel")')
+    search_parser.add_argument('-n', '--limit', type=int, default=20, help='Maximum number of results (default: 20)')
+    search_parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from the state file before searching')
+    trends_parser = subparsers.add_parser('trends', help='Show the challenges that got the most solves (or lost the most points) recently')
+    trends_parser.add_argument('--hours', type=float, default=24, help='Time window (default: 24)')
+    trends_parser.add_argument('--platform', default=None, help='Only this platform')
+    trends_parser.add_argument('--by', choices=['solves', 'value'], default='solves', help='Sort by new solves or by score drop (default: solves)')
+    trends_parser.add_argument('-n', '--limit', type=int, default=20, help='Maximum number of results (default: 20)')
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_arguments()
     script_dir = os.path.dirname(os.path.abspath(__file__))
     caller_cwd = os.getcwd()
     config_file_path = os.path.join(script_dir, 'config.ini')
 
+    # Paths given on the command line are relative to where the script was launched
+    profiler = None
+    if args.profile is not None:
+        profiler = RunProfiler(os.path.abspath(args.profile))
+        profiler.start()
+    http_cassette_path = args.record_http or args.replay_http
+    if http_cassette_path:
+        http_cassette_path = os.path.abspath(http_cassette_path)
+    
+    attachment_pipeline = None
+    score_history = None
+    http_cassette = None
     try:
         os.chdir(script_dir)
         print(f'Current working directory: {os.getcwd()}')
@@ -91,23 +219,104 @@ if __name__ == "__main__":
             state_file_name_from_config = default_state_file_name
             print(f"No [global_settings] section found. Using defaults: Main directory='{main_challenges_dir_from_config}', State file='{state_file_name_from_config}'")
 
+        log_level_from_config = 'DEBUG' if args.verbose else config.get('global_settings', 'log_level', fallback='INFO')
+        json_log_file_from_config = config.get('global_settings', 'json_log_file', fallback='') or None
+        try:
+            setup_logging(log_level_from_config, json_log_file_from_config)
+        except (ValueError, OSError) as e:
+            print(f"Cannot set up logging: {e}")
+            exit(1)
+
+        # Order in which pending challenges are updated
+        update_priority_from_config = config.get('global_settings', 'update_priority', fallback=', '.join(DEFAULT_PRIORITY))
+        checkpoint_seconds_from_config = config.getfloat('global_settings', 'state_checkpoint_seconds', fallback=30)
+        try:
+            update_scheduler = UpdateScheduler.from_string(update_priority_from_config)
+        except ValueError as e:
+            logger.error(f"Invalid 'update_priority' in [global_settings]: {e}")
+            exit(1)
+        
+        # Attachment download limits, for the whole run and for each platform
+        try:
+            global_download_budget = DownloadBudget.from_config(config, 'global_settings')
+        except ValueError as e:
+            logger.error(f"Invalid download budget in [global_settings]: {e}")
+            exit(1)
+        download_budgets = {}
+        
+        # Which pending challenges to update, checked before any request for them
+        select_from_config = args.select if args.select is not None else config.get('global_settings', 'select', fallback='')
+        try:
+            challenge_selector = ChallengeSelector.from_string(select_from_config) if select_from_config.strip() else None
+        except ValueError as e:
+            logger.error(f"Invalid challenge selector '{select_from_config}': {e}")
+            exit(1)
+
         all_challenges_from_all_platforms = []
+        pending_platform_categories = defaultdict(int)
         active_connectors = {} 
+        account_connectors = {} # {platform_key: {account_name: connector}}
         
         # Pass the loaded global settings to ChallengeStateManager
         state_manager = ChallengeStateManager(
             main_challenges_dir=main_challenges_dir_from_config,
-            state_file_name=state_file_name_from_config
+            state_file_name=state_file_name_from_config,
+            checkpoint_interval=checkpoint_seconds_from_config
         )
+        
+        # Full-text index of the challenges, kept next to the state file
+        search_index_file_from_config = config.get('global_settings', 'search_index_file', fallback='search_index.sqlite')
+        search_index = SearchIndex(os.path.join(main_challenges_dir_from_config, search_index_file_from_config))
+        state_manager.search_index = search_index
+        
+        # Optional: classify and extract the attachments on a process pool, while downloading the next ones
+        if config.getboolean('global_settings', 'process_attachments', fallback=False):
+            workers_from_config = config.get('global_settings', 'attachment_workers', fallback='')
+            # Empty extraction limits mean no limit
+            max_files_from_config = config.get('global_settings', 'max_extracted_files', fallback='10000')
+            attachment_pipeline = AttachmentPipeline(
+                workers=int(workers_from_config) if workers_from_config.strip() else None,
+                extract=config.getboolean('global_settings', 'extract_archives', fallback=True),
+                max_extracted_bytes=parse_size(config.get('global_settings', 'max_extracted_bytes', fallback='1GB')),
+                max_extracted_files=int(max_files_from_config) if max_files_from_config.strip() else None
+            )
+            state_manager.attachment_pipeline = attachment_pipeline
+        if (search_index.is_empty() and state_manager.state) or (args.command == 'search' and args.rebuild):
+            logger.info("Building the search index from the state file...")
+            state_manager.rebuild_search_index()
+        
+        if args.command == 'search':
+            flush_logs()
+            run_search(search_index, ' '.join(args.query), args.limit)
+            exit(0)
+        
+        # History of the value and solves of every challenge, one snapshot per sync
+        score_history_file_from_config = config.get('global_settings', 'score_history_file', fallback='score_history.sqlite')
+        score_history = ScoreHistory(os.path.join(main_challenges_dir_from_config, score_history_file_from_config))
+        
+        if args.command == 'trends':
+            flush_logs()
+            run_trends(score_history, state_manager, args.hours, args.platform, args.by, args.limit)
+            exit(0)
 
-        print("\nProcessing configured CTF platforms...")
+        if http_cassette_path:
+            try:
+                http_cassette = HttpCassette(http_cassette_path, 'record' if args.record_http else 'replay')
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Cannot load the HTTP responses from '{http_cassette_path}': {e}")
+                exit(1)
+            logger.info(f"{'Recording' if args.record_http else 'Replaying'} HTTP responses ({http_cassette_path})")
+        
+        logger.info("Processing configured CTF platforms...")
         for platform_key in config.sections():
             if platform_key == 'global_settings': # Skip the global_settings section
                 continue
+            if ':' in platform_key: # Other accounts, handled with their platform
+                continue
             
-            print(f"\n--- Platform: {platform_key} ---")
+            logger.info(f"--- Platform: {platform_key} ---")
             if not config.getboolean(platform_key, 'enabled', fallback=False):
-                print(f"Platform '{platform_key}' is disabled. Skipping.")
+                logger.info(f"Platform '{platform_key}' is disabled. Skipping.")
                 continue
 
             base_url = config.get(platform_key, 'base_url', fallback=None)
@@ -116,55 +325,108 @@ if __name__ == "__main__":
             connector_class_str = config.get(platform_key, 'connector', fallback=None)
 
             if not all([base_url, connector_class_str]):
-                print(f"Missing 'base_url' or 'connector' for '{platform_key}'. Skipping.")
+                logger.warning(f"Missing 'base_url' or 'connector' for '{platform_key}'. Skipping.")
                 continue
             
             ConnectorClass = dynamically_import_connector(connector_class_str)
             if not ConnectorClass:
-                print(f"Could not load connector for '{platform_key}'. Skipping.")
+                logger.warning(f"Could not load connector for '{platform_key}'. Skipping.")
+                continue
+
+            try:
+                download_budgets[platform_key] = DownloadBudget.from_config(config, platform_key, parent=global_download_budget)
+            except ValueError as e:
+                logger.warning(f"Invalid download budget for '{platform_key}': {e}. Skipping.")
                 continue
 
             # Instantiate connector
             connector_instance = ConnectorClass(base_url, username, password)
+            connector_instance.download_throttle = download_budgets[platform_key].throttle
+            if http_cassette is not None:
+                http_cassette.attach(connector_instance.session)
             
-            print(f"Attempting login to '{platform_key}'...")
+            logger.info(f"Attempting login to '{platform_key}'...")
             if connector_instance.login():
-                print(f"Successfully logged into '{platform_key}'.")
+                logger.info(f"Successfully logged into '{platform_key}'.")
                 active_connectors[platform_key] = connector_instance
                 
-                print(f"Fetching challenges from '{platform_key}'...")
-                platform_challenges = connector_instance.get_challenges()
+                if args.download_deferred: # No need for the challenges list
+                    continue
+                
+                # Challenges are downloaded once, with this account. The other accounts are only used for their solve status
+                main_account_name = config.get(platform_key, 'account_name', fallback=username or 'main')
+                account_connectors[platform_key] = {main_account_name: connector_instance}
+                account_connectors[platform_key].update(login_other_accounts(config, platform_key, ConnectorClass, base_url, http_cassette))
+                
+                logger.info(f"Fetching challenges from '{platform_key}'...")
+                platform_challenges = connector_instance.iter_challenges()
                 
                 if platform_challenges is not None:
-                    # Tag challenges with their platform
-                    for chal in platform_challenges:
-                        chal['platform'] = platform_key 
-                    all_challenges_from_all_platforms.extend(platform_challenges)
-                    print(f"Fetched {len(platform_challenges)} challenges from '{platform_key}'.")
+                    # Classify challenges while the list is still downloading
+                    fetched_before = len(all_challenges_from_all_platforms)
+                    try:
+                        platform_pending_categories = get_pending_categories(
+                            state_manager,
+                            tag_challenges(platform_key, platform_challenges, all_challenges_from_all_platforms),
+                            selector=challenge_selector
+                        )
+                    except IncompleteListError:
+                        # A partial list would drop the missing challenges from the state: skip the platform
+                        del all_challenges_from_all_platforms[fetched_before:]
+                        logger.warning(f"Failed to fetch the whole challenges list from '{platform_key}'. Skipping.")
+                        continue
+                    for platform_category_key, count in platform_pending_categories.items():
+                        pending_platform_categories[platform_category_key] += count
+                    logger.info(f"Fetched {len(all_challenges_from_all_platforms) - fetched_before} challenges from '{platform_key}'.")
                 else:
-                    print(f"Failed to fetch challenges from '{platform_key}'.")
+                    logger.warning(f"Failed to fetch challenges from '{platform_key}'.")
             else:
-                print(f"Login failed for '{platform_key}'.")
+                logger.warning(f"Login failed for '{platform_key}'.")
+        
+        if args.download_deferred:
+            logger.info("--- Downloading Deferred Attachments ---")
+            state_manager.download_deferred(active_connectors, download_budgets)
+            logger.info("Saving current challenge state...")
+            state_manager.save_state()
+            logger.info("Challenge state saved.")
+            exit(0)
         
         if not all_challenges_from_all_platforms:
-            print("\nNo challenges fetched from any platform. Exiting.")
+            logger.info("No challenges fetched from any platform. Exiting.")
             exit(0)
+        
+        changed_count = score_history.record(all_challenges_from_all_platforms)
+        logger.info(f"Score history: {changed_count} challenges changed value or solves since the last sync.")
             
-        print("\n--- Challenge Status Summary ---")
-        pending_platform_categories = get_pending_categories(state_manager, all_challenges_from_all_platforms)
-        selected_platform_category_key = prompt_for_category_selection(pending_platform_categories)
+        logger.info("--- Challenge Status Summary ---")
+        if challenge_selector is not None:
+            unselected_count = sum(1 for chal in all_challenges_from_all_platforms if chal.pending) - sum(pending_platform_categories.values())
+            logger.info(f"{unselected_count} pending challenges not matched by the selector '{select_from_config}' are left as they are.")
+        flush_logs() # Don't mix queued log lines with the prompt
+        if args.yes:
+            selected_platform_category_key = "" if pending_platform_categories else None
+            if selected_platform_category_key is None:
+                logger.info('All challenges are up to date across all platforms.')
+        else:
+            selected_platform_category_key = prompt_for_category_selection(pending_platform_categories)
         
         if selected_platform_category_key is not None: # If None, user chose to update nothing
-            print(f"\n--- Updating Challenges ({selected_platform_category_key if selected_platform_category_key else 'All Pending'}) ---")
+            logger.info(f"--- Updating Challenges ({selected_platform_category_key if selected_platform_category_key else 'All Pending'}) ---")
             state_manager.update(
                 all_challenges=all_challenges_from_all_platforms, 
                 connectors_map=active_connectors, # Pass the map of active connectors
-                selected_category_filter=selected_platform_category_key
+                selected_category_filter=selected_platform_category_key,
+                scheduler=update_scheduler,
+                budgets=download_budgets,
+                account_connectors=account_connectors,
+                selector=challenge_selector
             )
+        else: # Nothing downloaded, but the new challenges are recorded (first seen now)
+            state_manager.record_new_challenges(all_challenges_from_all_platforms)
         
-        print("\nSaving current challenge state...")
+        logger.info("Saving current challenge state...")
         state_manager.save_state()
-        print("Challenge state saved.")
+        logger.info("Challenge state saved.")
 
     except FileNotFoundError:
         print(f"Error: config.ini not found at {config_file_path}. Please create it.")
@@ -173,5 +435,14 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
     finally:
+        if attachment_pipeline is not None:
+            attachment_pipeline.shutdown()
+        if score_history is not None:
+            score_history.close()
+        if http_cassette is not None:
+            http_cassette.close()
+        if profiler is not None:
+            profiler.stop()
+        shutdown_logging()
         os.chdir(caller_cwd)
         print(f'\nRestored working directory to: {os.getcwd()}')
\ No newline at end of file
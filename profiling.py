@@ -0,0 +1,81 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+class RunProfiler:
+    # cProfile of the main thread, plus a wall-clock sampler of every thread (time spent waiting
+    # on the network or the disk shows up here, not in cProfile)
+    def __init__(self, output_dir: str, sample_interval: float = 0.005):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+
+        self._profile = cProfile.Profile()
+        self._samples = Counter() # {folded stack: count}
+        self._sample_count = 0
+        self._stop_event = threading.Event()
+        self._sampler_thread = None
+        self._start_time = None
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._sampler_thread = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+        self._sampler_thread.start()
+        self._profile.enable()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.sample_interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._samples[self._fold_stack(thread_names.get(thread_id, str(thread_id)), frame)] += 1
+            self._sample_count += 1
+
+    @staticmethod
+    def _fold_stack(thread_name: str, frame):
+        # "thread;outer (file:line);...;inner (file:line)", the format of flamegraph.pl and speedscope
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        names.append(thread_name)
+        return ';'.join(reversed(names)).replace(' ', '_')
+
+    def stop(self):
+        # Stop profiling and write the reports, return their paths
+        self._profile.disable()
+        self._stop_event.set()
+        self._sampler_thread.join()
+        wall_time = time.perf_counter() - self._start_time
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_path = os.path.join(self.output_dir, time.strftime('sync_%Y%m%d_%H%M%S'))
+        paths = [base_path + '.pstats', base_path + '.txt', base_path + '.folded']
+
+        self._profile.dump_stats(paths[0])
+
+        with open(paths[1], 'w', encoding='utf-8') as f:
+            f.write(f"Wall time: {wall_time:.3f} s, {self._sample_count} samples every {self.sample_interval * 1000:g} ms\n")
+            for sort_key in ('cumulative', 'tottime'):
+                report = io.StringIO()
+                stats = pstats.Stats(self._profile, stream=report)
+                stats.strip_dirs().sort_stats(sort_key).print_stats(50)
+                f.write(f"\n===== Sorted by {sort_key} =====\n")
+                f.write(report.getvalue())
+
+        with open(paths[2], 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self._samples.items()):
+                f.write(f"{stack} {count}\n")
+
+        logger.info(f"Profile of {wall_time:.1f} s written to {base_path}.* (.pstats, .txt, .folded)")
+        return paths
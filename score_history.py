@@ -0,0 +1,155 @@
+import sqlite3
+import time
+
+from challenge_record import ChallengeSummary
+
+# Only changes are stored: the value and solves of a challenge at time T are the ones of
+# its last snapshot with time <= T. 'polls' says when each platform was checked
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS challenge_keys (
+    key INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL,
+    challenge_id NOT NULL, -- No type, ids keep their type (int or str)
+    UNIQUE (platform, challenge_id)
+);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    key INTEGER NOT NULL,
+    time INTEGER NOT NULL, -- Unix time, seconds
+    value INTEGER,
+    solves INTEGER,
+    PRIMARY KEY (key, time)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS polls (
+    platform TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    PRIMARY KEY (platform, time)
+) WITHOUT ROWID;
+'''
+
+class ScoreHistory:
+    # Append-only history of the value and solves of every challenge
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(_SCHEMA)
+
+        self._keys = None # {(platform, challenge_id): key}
+        self._last = None # {key: (value, solves)}
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def _load_cache(self):
+        self._keys = {(platform, challenge_id): key for key, platform, challenge_id in
+                      self.connection.execute('SELECT key, platform, challenge_id FROM challenge_keys')}
+        self._last = {key: (value, solves) for key, value, solves in self.connection.execute(
+            '''SELECT s.key, s.value, s.solves FROM snapshots s
+               WHERE s.time = (SELECT MAX(time) FROM snapshots WHERE key = s.key)''')}
+
+    def _get_key(self, platform, challenge_id):
+        key = self._keys.get((platform, challenge_id))
+        if key is None:
+            key = self.connection.execute('INSERT INTO challenge_keys (platform, challenge_id) VALUES (?, ?)',
+                                          (platform, challenge_id)).lastrowid
+            self._keys[(platform, challenge_id)] = key
+        return key
+
+    def record(self, challenges: list[ChallengeSummary], timestamp: int = None):
+        # Save a snapshot of the challenges of a sync (only what changed). Return the number of changes
+        if timestamp is None:
+            timestamp = int(time.time())
+        if self._keys is None:
+            self._load_cache()
+
+        new_rows = []
+        platforms = set()
+        with self.connection:
+            for chal in challenges:
+                platforms.add(chal.platform)
+                key = self._get_key(chal.platform, chal.id)
+                observation = (chal.value, chal.solves)
+                if self._last.get(key) != observation:
+                    new_rows.append((key, timestamp, chal.value, chal.solves))
+                    self._last[key] = observation
+
+            self.connection.executemany('INSERT OR REPLACE INTO snapshots (key, time, value, solves) VALUES (?, ?, ?, ?)', new_rows)
+            self.connection.executemany('INSERT OR IGNORE INTO polls (platform, time) VALUES (?, ?)',
+                                        [(platform, timestamp) for platform in platforms])
+        return len(new_rows)
+
+    def history(self, platform, challenge_id, since: int = None, until: int = None):
+        # [(time, value, solves)] of a challenge between 'since' and 'until' (Unix times, None for no limit).
+        # The first item is the snapshot that was still valid at 'since'
+        key_row = self.connection.execute('SELECT key FROM challenge_keys WHERE platform = ? AND challenge_id = ?',
+                                          (platform, challenge_id)).fetchone()
+        if key_row is None:
+            return []
+        key = key_row[0]
+
+        if until is None:
+            until = int(time.time())
+        if since is not None:
+            start_time = self.connection.execute('SELECT MAX(time) FROM snapshots WHERE key = ? AND time <= ?', (key, since)).fetchone()[0]
+            since = start_time if start_time is not None else since
+        else:
+            since = 0
+
+        return self.connection.execute(
+            'SELECT time, value, solves FROM snapshots WHERE key = ? AND time BETWEEN ? AND ? ORDER BY time',
+            (key, since, until)
+        ).fetchall()
+
+    def snapshot_at(self, timestamp: int, platform: str = None):
+        # {(platform, challenge_id): (value, solves)} at a given time
+        query = '''SELECT k.platform, k.challenge_id, s.value, s.solves
+                   FROM snapshots s JOIN challenge_keys k ON k.key = s.key
+                   WHERE s.time = (SELECT MAX(time) FROM snapshots WHERE key = s.key AND time <= ?)'''
+        parameters = [timestamp]
+        if platform is not None:
+            query += ' AND k.platform = ?'
+            parameters.append(platform)
+        return {(p, challenge_id): (value, solves) for p, challenge_id, value, solves in self.connection.execute(query, parameters)}
+
+    def deltas(self, since: int, until: int = None, platform: str = None):
+        # How value and solves changed between 'since' and 'until', one dict per challenge.
+        # Challenges first seen after 'since' start from their first snapshot
+        if until is None:
+            until = int(time.time())
+        start = self.snapshot_at(since, platform)
+        end = self.snapshot_at(until, platform)
+
+        first_seen = {}
+        query = '''SELECT k.platform, k.challenge_id, s.value, s.solves, s.time
+                   FROM snapshots s JOIN challenge_keys k ON k.key = s.key
+                   WHERE s.time = (SELECT MIN(time) FROM snapshots WHERE key = s.key) AND s.time > ? AND s.time <= ?'''
+        for p, challenge_id, value, solves, first_time in self.connection.execute(query, (since, until)):
+            first_seen[(p, challenge_id)] = (value, solves)
+
+        results = []
+        for (p, challenge_id), (end_value, end_solves) in end.items():
+            start_value, start_solves = start.get((p, challenge_id)) or first_seen.get((p, challenge_id), (end_value, end_solves))
+            results.append({
+                'platform': p,
+                'id': challenge_id,
+                'value_start': start_value,
+                'value_end': end_value,
+                'value_delta': (end_value or 0) - (start_value or 0),
+                'solves_start': start_solves,
+                'solves_end': end_solves,
+                'solves_delta': (end_solves or 0) - (start_solves or 0),
+            })
+        return results
+
+    def trending(self, since: int, until: int = None, platform: str = None, by: str = 'solves', limit: int = 20):
+        # Challenges with the most new solves (by='solves') or the largest score drop (by='value')
+        results = self.deltas(since, until, platform)
+        if by == 'value':
+            results = [r for r in results if r['value_delta'] < 0]
+            results.sort(key = lambda r: r['value_delta'])
+        else:
+            results = [r for r in results if r['solves_delta'] > 0]
+            results.sort(key = lambda r: r['solves_delta'], reverse = True)
+        return results[:limit]
@@ -0,0 +1,110 @@
+import logging
+import sqlite3
+
+from challenge_record import ChallengeDetails
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS challenges (
+    rowid INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL,
+    challenge_id TEXT NOT NULL,
+    name TEXT,
+    category TEXT,
+    description TEXT,
+    value INTEGER,
+    folder TEXT,
+    UNIQUE (platform, challenge_id)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS challenges_fts USING fts5(
+    name, category, description,
+    content = 'challenges', content_rowid = 'rowid',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- Keep the full-text index in sync with the challenges table
+CREATE TRIGGER IF NOT EXISTS challenges_after_insert AFTER INSERT ON challenges BEGIN
+    INSERT INTO challenges_fts (rowid, name, category, description) VALUES (new.rowid, new.name, new.category, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS challenges_after_delete AFTER DELETE ON challenges BEGIN
+    INSERT INTO challenges_fts (challenges_fts, rowid, name, category, description) VALUES ('delete', old.rowid, old.name, old.category, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS challenges_after_update AFTER UPDATE ON challenges BEGIN
+    INSERT INTO challenges_fts (challenges_fts, rowid, name, category, description) VALUES ('delete', old.rowid, old.name, old.category, old.description);
+    INSERT INTO challenges_fts (rowid, name, category, description) VALUES (new.rowid, new.name, new.category, new.description);
+END;
+'''
+
+# Weight of name, category and description in the ranking
+_BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+class SearchIndex:
+    # Full-text index (SQLite FTS5) over the names, categories and descriptions of the challenges
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def commit(self):
+        self.connection.commit()
+
+    def is_empty(self):
+        return self.connection.execute('SELECT 1 FROM challenges LIMIT 1').fetchone() is None
+
+    def upsert(self, chal: ChallengeDetails, folder: str = None):
+        self.connection.execute(
+            '''INSERT INTO challenges (platform, challenge_id, name, category, description, value, folder)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (platform, challenge_id) DO UPDATE SET
+                   name = excluded.name, category = excluded.category, description = excluded.description,
+                   value = excluded.value, folder = excluded.folder''',
+            (chal.platform, str(chal.id), chal.name, chal.category, chal.description, chal.value, folder)
+        )
+
+    def rebuild(self, challenges_with_folders):
+        # Replace the whole index, 'challenges_with_folders' is an iterable of (ChallengeDetails, folder)
+        with self.connection:
+            self.connection.execute('DELETE FROM challenges')
+            for chal, folder in challenges_with_folders:
+                self.upsert(chal, folder)
+
+    def search(self, query: str, limit: int = 20):
+        # Return a list of dicts, best match first.
+        # 'query' uses the FTS5 syntax (e.g. "heap AND NOT kernel", "rsa*"), plain words are also fine
+        try:
+            return self._search(query, limit)
+        except sqlite3.OperationalError as e:
+            # Not a valid FTS5 query (e.g. "c++"): search the words as they are
+            logger.debug(f"Invalid FTS query '{query}' ({e}), searching the plain words")
+            quoted_query = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+            return self._search(quoted_query, limit)
+
+    def _search(self, query: str, limit: int):
+        rows = self.connection.execute(
+            f'''SELECT c.platform, c.challenge_id, c.name, c.category, c.value, c.folder,
+                       snippet(challenges_fts, -1, '[', ']', '...', 12)
+                FROM challenges_fts JOIN challenges c ON c.rowid = challenges_fts.rowid
+                WHERE challenges_fts MATCH ?
+                ORDER BY bm25(challenges_fts, {', '.join(map(str, _BM25_WEIGHTS))})
+                LIMIT ?''',
+            (query, limit)
+        ).fetchall()
+
+        results = []
+        for platform, challenge_id, name, category, value, folder, snippet in rows:
+            results.append({
+                'platform': platform,
+                'id': challenge_id,
+                'name': name,
+                'category': category,
+                'value': value,
+                'folder': folder,
+                'snippet': snippet,
+            })
+        return results
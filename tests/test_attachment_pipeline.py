@@ -0,0 +1,113 @@
+import io
+import os
+import stat
+import tarfile
+import zipfile
+
+import pytest
+
+from attachment_pipeline import ExtractionLimitError, _extract_tar, _extract_zip, _safe_destination_path
+
+def make_zip(path, members):
+    # members: [(name, content)] or [(zipfile.ZipInfo, content)]
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+    return path
+
+def make_tar(path, members):
+    # members: [tarfile.TarInfo with its data]
+    with tarfile.open(path, 'w:gz') as archive:
+        for info, content in members:
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return path
+
+def tar_member(name, member_type=tarfile.REGTYPE, linkname=''):
+    info = tarfile.TarInfo(name)
+    info.type = member_type
+    info.linkname = linkname
+    return info
+
+def list_files(folder):
+    return sorted(os.path.relpath(os.path.join(root, name), folder) for root, _, names in os.walk(folder) for name in names)
+
+@pytest.mark.parametrize('member_name', ['../evil', 'a/../../evil', '/etc/evil', '\\\\server\\evil', '..\\evil', '', '.'])
+def test_unsafe_destination_paths(tmp_path, member_name):
+    assert _safe_destination_path(str(tmp_path), member_name) is None
+
+def test_safe_destination_path(tmp_path):
+    assert _safe_destination_path(str(tmp_path), 'a/./b/../flag.txt') == os.path.join(os.path.realpath(tmp_path), 'a', 'flag.txt')
+
+def test_destination_through_symlink(tmp_path):
+    destination = tmp_path / 'out'
+    destination.mkdir()
+    (destination / 'link').symlink_to(tmp_path)
+    assert _safe_destination_path(str(destination), 'link/evil') is None
+
+def test_zip_unsafe_members_are_skipped(tmp_path):
+    archive_path = make_zip(tmp_path / 'chal.zip', [('../evil', b'x'), ('/abs/evil', b'x'), ('dir/flag.txt', b'flag')])
+    destination = tmp_path / 'out'
+    destination.mkdir()
+    skipped = []
+
+    extracted = _extract_zip(archive_path, str(destination), None, None, skipped)
+
+    assert extracted == [os.path.join(os.path.realpath(destination), 'dir', 'flag.txt')]
+    assert skipped == ['../evil', '/abs/evil']
+    assert list_files(tmp_path) == ['chal.zip', os.path.join('out', 'dir', 'flag.txt')]
+
+def test_zip_symlink_is_extracted_as_a_file(tmp_path):
+    info = zipfile.ZipInfo('link')
+    info.external_attr = (stat.S_IFLNK | 0o777) << 16
+    archive_path = make_zip(tmp_path / 'chal.zip', [(info, '/etc/passwd')])
+    destination = tmp_path / 'out'
+    destination.mkdir()
+
+    _extract_zip(archive_path, str(destination), None, None, [])
+
+    assert not os.path.islink(destination / 'link')
+    assert (destination / 'link').read_bytes() == b'/etc/passwd'
+
+def test_zip_limits(tmp_path):
+    archive_path = make_zip(tmp_path / 'chal.zip', [('a', b'1' * 100), ('b', b'2' * 100), ('c', b'3')])
+    destination = tmp_path / 'out'
+    destination.mkdir()
+
+    with pytest.raises(ExtractionLimitError):
+        _extract_zip(archive_path, str(destination), 150, None, [])
+    assert list_files(destination) == ['a'] # The member over the limit is removed
+
+    with pytest.raises(ExtractionLimitError):
+        _extract_zip(archive_path, str(destination), None, 2, [])
+
+def test_tar_unsafe_members_are_skipped(tmp_path):
+    archive_path = make_tar(tmp_path / 'chal.tar.gz', [
+        (tar_member('../evil'), b'x'),
+        (tar_member('/abs/evil'), b'x'),
+        (tar_member('link', tarfile.SYMTYPE, '/etc/passwd'), b''),
+        (tar_member('hard', tarfile.LNKTYPE, '../evil'), b''),
+        (tar_member('dir', tarfile.DIRTYPE), b''),
+        (tar_member('dir/flag.txt'), b'flag'),
+    ])
+    destination = tmp_path / 'out'
+    destination.mkdir()
+    skipped = []
+
+    extracted = _extract_tar(archive_path, str(destination), None, None, skipped)
+
+    assert extracted == [os.path.join(os.path.realpath(destination), 'dir', 'flag.txt')]
+    assert skipped == ['../evil', '/abs/evil', 'link', 'hard']
+    assert list_files(tmp_path) == ['chal.tar.gz', os.path.join('out', 'dir', 'flag.txt')]
+
+def test_tar_limits(tmp_path):
+    archive_path = make_tar(tmp_path / 'chal.tar.gz', [(tar_member('a'), b'1' * 100), (tar_member('b'), b'2' * 100), (tar_member('c'), b'3')])
+    destination = tmp_path / 'out'
+    destination.mkdir()
+
+    with pytest.raises(ExtractionLimitError):
+        _extract_tar(archive_path, str(destination), 150, None, [])
+    assert list_files(destination) == ['a']
+
+    with pytest.raises(ExtractionLimitError):
+        _extract_tar(archive_path, str(destination), None, 2, [])
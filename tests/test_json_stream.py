@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from website_connectors.json_stream import iter_json_array
+
+def split_in_chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def assert_same_items_for_every_chunk_size(document: bytes, key: str):
+    expected = json.loads(document)[key]
+    for size in range(1, len(document) + 1):
+        assert list(iter_json_array(split_in_chunks(document, size), key)) == expected, f"chunk size {size}"
+
+def test_objects():
+    document = '{"success": true, "data": [{"id": 1, "name": "Baby ROP"}, {"id": 2, "name": "caffè", "tags": ["a]", "b,"]}]}'.encode('utf-8')
+    assert_same_items_for_every_chunk_size(document, 'data')
+
+def test_scalars_cut_by_chunk_boundaries():
+    document = b'{"events":[1.5e3,2, -0.25 ,true,false,null,"s\\u00e8",12345678901234567890,[4,5]]}'
+    assert_same_items_for_every_chunk_size(document, 'events')
+
+def test_key_after_other_values():
+    document = b'{"meta": {"events": [0]}, "list": [1, 2], "events": [3, 4]}'
+    assert_same_items_for_every_chunk_size(document, 'events')
+
+def test_missing_key():
+    assert list(iter_json_array([b'{"data": [1, 2]}'], 'events')) == []
+
+def test_truncated_stream():
+    document = b'{"data": [{"id": 1}, {"id": 2}, {"id"'
+    for size in range(1, len(document) + 1):
+        with pytest.raises(ValueError):
+            list(iter_json_array(split_in_chunks(document, size), 'data'))
+
+def test_large_item_in_small_chunks():
+    # Brackets and escaped quotes inside strings must not change where the item ends
+    challenges = [{'id': i, 'name': f'chal "{i}" [x] {{y}}', 'tags': ['a\\', 'b'], 'hint': None} for i in range(2000)]
+    document = json.dumps({'events': [{'standings': challenges}, 7]}).encode('utf-8')
+    for size in (1, 7, 1000):
+        assert list(iter_json_array(split_in_chunks(document, size), 'events')) == [{'standings': challenges}, 7]
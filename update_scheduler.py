@@ -0,0 +1,50 @@
+from challenge_record import ChallengeSummary, Attachment
+
+# Sort keys for the update queue, smaller comes first
+PRIORITY_KEYS = {
+    'new': lambda chal, is_new: not is_new,                  # New challenges before changed ones
+    'unsolved': lambda chal, is_new: bool(chal.solved_by_me), # Unsolved before solved
+    'solves': lambda chal, is_new: chal.solves if chal.solves is not None else 0, # Fewer solves first
+    'value': lambda chal, is_new: -(chal.value or 0),         # Higher score first
+}
+DEFAULT_PRIORITY = ['new', 'unsolved', 'solves', 'value']
+
+class UpdateScheduler:
+    def __init__(self, priority_order: list[str] = None):
+        if priority_order is None:
+            priority_order = DEFAULT_PRIORITY
+
+        unknown_keys = [key for key in priority_order if key not in PRIORITY_KEYS]
+        if unknown_keys:
+            raise ValueError(f"Unknown priority keys {unknown_keys}. Valid keys: {', '.join(PRIORITY_KEYS)}")
+        self.priority_order = list(priority_order)
+
+    @classmethod
+    def from_string(cls, priority_string: str):
+        # e.g. "new, unsolved, solves"
+        keys = [key.strip() for key in priority_string.split(',') if key.strip()]
+        return cls(keys)
+
+    def order(self, challenges: list[ChallengeSummary], state_manager):
+        # Sort the challenges to update, most useful first.
+        # Must be called before the state is updated, to know which challenges are new
+        key_functions = [PRIORITY_KEYS[key] for key in self.priority_order]
+
+        def sort_key(chal):
+            is_new = state_manager.is_new_challenge(chal.platform, chal.id)
+            return tuple(fn(chal, is_new) for fn in key_functions)
+
+        return sorted(challenges, key = sort_key) # Stable: ties keep the platform order
+
+    @staticmethod
+    def order_attachments(attachments: list[Attachment], connector):
+        # Small attachments first, the size is asked to the platform (HEAD) if unknown.
+        # Attachments with unknown size go last, in their original order
+        if len(attachments) < 2:
+            return list(attachments)
+
+        for attachment in attachments:
+            if attachment.size is None:
+                attachment.size = connector.get_attachment_size(attachment.url)
+
+        return sorted(attachments, key = lambda a: (a.size is None, a.size or 0))
@@ -1,6 +1,16 @@
 from abc import ABC, abstractmethod
+import logging
 import requests
 
+from .json_stream import iter_json_array
+
+logger = logging.getLogger(__name__)
+
+class IncompleteListError(Exception):
+    # The challenges list stopped before its end (malformed JSON, connection lost):
+    # the challenges already yielded are only a part of it
+    pass
+
 class WebsiteConnectorBase(ABC):
 
     def __init__(self, base_url, username=None, password=None):
@@ -10,6 +20,12 @@ class WebsiteConnectorBase(ABC):
         
         self.session = requests.Session()
         self.logged_in = False
+        
+        # Called with the size of every downloaded chunk of an attachment (e.g. DownloadBudget.throttle).
+        # It can raise to stop the download, the exception reaches the caller of download_attachment
+        self.download_throttle = None
+        
+        self._solved_challenge_ids = None # Cache for is_solved_by_me
 
     def _get_page_content(self, url, headers = None):
         # Normal GET request
@@ -18,9 +34,61 @@ class WebsiteConnectorBase(ABC):
             response.raise_for_status()
             return response
         except requests.exceptions.RequestException as e:
-            print(f"Error during GET from {url}: {e}")
+            logger.warning(f"Error during GET from {url}: {e}")
+            return None
+
+    def _stream_page_content(self, url, headers = None):
+        # GET request, the body is read lazily (response.iter_content)
+        try:
+            response = self.session.get(url, headers = headers, allow_redirects=True, timeout = 10, stream = True)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error during GET from {url}: {e}")
+            return None
+
+    def _download_content(self, url, headers = None, chunk_size = 64 * 1024):
+        # Download a file in chunks (so download_throttle can slow it down), None on failure
+        response = self._stream_page_content(url, headers = headers)
+        if response is None:
+            return None
+        
+        chunks = []
+        try:
+            for chunk in response.iter_content(chunk_size = chunk_size):
+                chunks.append(chunk)
+                if self.download_throttle:
+                    self.download_throttle(len(chunk))
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error while downloading {url}: {e}")
+            return None
+        finally:
+            response.close()
+        
+        return b''.join(chunks)
+
+    def _head_page_content(self, url, headers = None):
+        # HEAD request, used to know the size of a file before downloading it
+        try:
+            response = self.session.head(url, headers = headers, allow_redirects=True, timeout = 10)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error during HEAD from {url}: {e}")
             return None
 
+    def _iter_json_array(self, response, key, chunk_size = 64 * 1024):
+        # Decode the items of response.json()[key] while the body is downloaded.
+        # Raise IncompleteListError if the body is malformed or the download fails
+        try:
+            yield from iter_json_array(response.iter_content(chunk_size = chunk_size), key)
+        except ValueError as e: # json.JSONDecodeError
+            raise IncompleteListError(f"cannot decode JSON: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise IncompleteListError(f"download interrupted: {e}") from e
+        finally:
+            response.close()
+
     @abstractmethod
     def login(self):
         # Login to the website
@@ -28,15 +96,59 @@ class WebsiteConnectorBase(ABC):
 
     @abstractmethod
     def get_challenges(self):
-        # Get challenges list
+        # Get challenges list: [ChallengeSummary], None on failure
         pass
 
+    def iter_challenges(self):
+        # Get challenges as an iterator, None on failure.
+        # Connectors can override this to yield challenges while the list is still downloading:
+        # the iterator then raises IncompleteListError if the list can't be read to its end
+        challenges = self.get_challenges()
+        if challenges is None:
+            return None
+        return iter(challenges)
+
     @abstractmethod
     def get_challenge_details(self, challenge_id):
-        # Challenge details, from id
+        # Challenge details, from id: (ChallengeDetails with its files as [Attachment], [solver name]), (None, None) on failure
         pass
 
+    def get_solved_challenge_ids(self):
+        # Ids of the challenges solved by this account, None on failure
+        challenges = self.iter_challenges()
+        if challenges is None:
+            return None
+        try:
+            return {chal.id for chal in challenges if chal.solved_by_me}
+        except IncompleteListError:
+            return None
+
+    def is_solved_by_me(self, challenge_details, solvers):
+        # Solve status of this account for a challenge whose details were fetched with another account
+        # (the details are downloaded once per platform, see ChallengeStateManager.update).
+        # By default it uses the challenges list of this account, fetched only once
+        if self._solved_challenge_ids is None:
+            self._solved_challenge_ids = self.get_solved_challenge_ids()
+            if self._solved_challenge_ids is None:
+                logger.warning(f"Cannot get the solved challenges of '{self.username}'")
+                self._solved_challenge_ids = set()
+        return challenge_details.id in self._solved_challenge_ids
+
+    def get_attachment_size(self, file_relative_url):
+        # Size in bytes of an attachment (from Content-Length), None if unknown
+        if not file_relative_url.startswith('/'):
+            file_relative_url = '/' + file_relative_url
+        
+        response = self._head_page_content(self.base_url + file_relative_url)
+        if response is None:
+            return None
+        
+        try:
+            return int(response.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return None
+
     @abstractmethod
     def download_attachment(self, file_relative_url):
-        # Download any attachments
+        # Download any attachments: the content as bytes, None on failure
         pass
\ No newline at end of file
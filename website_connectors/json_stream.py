@@ -0,0 +1,169 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = ' \t\n\r'
+_VALUE_DELIMITERS = _WHITESPACE + ',]' # What can follow an array item
+
+# A complete JSON string (with its quotes), matched in C instead of char by char
+_STRING_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Chars that matter while looking for the key, and inside an object or array
+_KEY_SCAN_PATTERN = re.compile(r'["{}\[\]:,]')
+# Everything up to the next bracket (outside strings) or incomplete string
+_SKIP_PATTERN = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL)
+
+def iter_json_array(chunks, key):
+    # Yield the items of the array stored at the top-level 'key' of a JSON object,
+    # decoding each item as soon as its bytes have arrived.
+    # 'chunks' is any iterable of bytes (e.g. response.iter_content()).
+    # Raises ValueError (json.JSONDecodeError) on malformed input.
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        # Drop what has already been consumed and append the next chunks.
+        # At least as much text as what is kept is read, so a long item is not copied again for every small chunk.
+        # Returns False when the stream is over.
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        kept_size = len(buf) - pos
+        texts = []
+        read_size = 0
+        while not eof and (read_size == 0 or read_size < kept_size):
+            try:
+                text = text_decoder.decode(next(chunks))
+            except StopIteration:
+                eof = True
+                text = text_decoder.decode(b'', final=True)
+            texts.append(text)
+            read_size += len(text)
+        buf = buf[pos:] + ''.join(texts)
+        pos = 0
+        return read_size > 0 or not eof
+
+    def peek():
+        # Next non-whitespace char (without consuming it), None at end of stream
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                return None
+
+    def error(msg):
+        return json.JSONDecodeError(msg, buf, pos)
+
+    def find_item_end():
+        # End of the object or array starting at 'pos', reading more chunks if needed.
+        # Strings and plain values are skipped by one regex call, only brackets are looked at
+        # in Python: an item spanning many chunks is scanned once and decoded once
+        scan = pos
+        depth = 0
+        while True:
+            scan = _SKIP_PATTERN.match(buf, scan).end()
+            if scan < len(buf) and buf[scan] != '"':
+                depth += 1 if buf[scan] in '{[' else -1
+                scan += 1
+                if depth == 0:
+                    return scan
+                continue
+
+            # End of the buffer, or a string that is not complete yet
+            offset = scan - pos # fill() moves the buffer
+            if not fill():
+                raise error('Unexpected end of stream inside array')
+            scan = pos + offset
+
+    # 1. Find the key inside the top-level object
+    if peek() != '{':
+        raise error("Expecting '{' at top level")
+    pos += 1
+
+    depth = 1
+    last_string = None # Last complete string seen at depth 1 (candidate key)
+
+    while True:
+        match = _KEY_SCAN_PATTERN.search(buf, pos)
+        if match is None:
+            pos = len(buf)
+            if not fill():
+                raise error('Unexpected end of stream')
+            continue
+
+        ch = match.group()
+        if ch == '"':
+            string_match = _STRING_PATTERN.match(buf, match.start())
+            if string_match is None: # The string is not complete yet
+                pos = match.start()
+                if not fill():
+                    raise error('Unexpected end of stream')
+                continue
+            pos = string_match.end()
+            if depth == 1:
+                last_string = json.loads(string_match.group())
+            continue
+
+        pos = match.end()
+        if ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                return # Key not found
+        elif ch == ':' and depth == 1:
+            if last_string == key:
+                break
+        elif ch == ',' and depth == 1:
+            last_string = None
+
+    # 2. Decode the array items one by one
+    first = peek()
+    if first != '[':
+        return # Key is present but it's not an array (e.g. null)
+    pos += 1
+
+    expect_item = True
+    while True:
+        ch = peek()
+        if ch is None:
+            raise error('Unexpected end of stream inside array')
+        if ch == ']':
+            return
+        if ch == ',':
+            if expect_item:
+                raise error('Unexpected ,')
+            pos += 1
+            expect_item = True
+            continue
+        if not expect_item:
+            raise error("Expecting ',' or ']'")
+
+        if ch in '{[':
+            item_end = find_item_end()
+            item, end = decoder.raw_decode(buf[pos:item_end])
+            end += pos
+        else:
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                    # A string ends with its quote. A number or literal could be cut by the chunk boundary
+                    # ("1" of "1.5e3"): only trust it when a delimiter follows
+                    if eof or (end < len(buf) and (ch == '"' or buf[end] in _VALUE_DELIMITERS)):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                if not fill():
+                    item, end = decoder.raw_decode(buf, pos)
+                    break
+
+        pos = end
+        expect_item = False
+        yield item
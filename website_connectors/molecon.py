@@ -1,5 +1,9 @@
+import logging
 from bs4 import BeautifulSoup
-from .base_website import WebsiteConnectorBase
+from challenge_record import ChallengeSummary, ChallengeDetails
+from .base_website import WebsiteConnectorBase, IncompleteListError
+
+logger = logging.getLogger(__name__)
 
 class WebsiteMolecon(WebsiteConnectorBase):
     def __init__(self, base_url, username, password):
@@ -11,7 +15,7 @@ class WebsiteMolecon(WebsiteConnectorBase):
         
     def login(self):
         if not self.username or not self.password:
-            print("[MOLECON] Missing credentials")
+            logger.error("[MOLECON] Missing credentials")
             return False
 
         login_url = self.base_url + self.login_path
@@ -20,7 +24,7 @@ class WebsiteMolecon(WebsiteConnectorBase):
         try:
             login_page_response = self._get_page_content(login_url)
             if not login_page_response:
-                print(f"[MOLECON] Error during login at {login_url}")
+                logger.error(f"[MOLECON] Error during login at {login_url}")
                 return False
             
             soup = BeautifulSoup(login_page_response.text, 'html.parser')
@@ -28,7 +32,7 @@ class WebsiteMolecon(WebsiteConnectorBase):
             if nonce_input and 'value' in nonce_input.attrs:
                 nonce_value = nonce_input['value']
             else:
-                print("[MOLECON] Cannot find nonce")
+                logger.error("[MOLECON] Cannot find nonce")
                 return False
 
             login_data = {
@@ -45,47 +49,57 @@ class WebsiteMolecon(WebsiteConnectorBase):
                 self.logged_in = True
                 return True
             else:
-                print(f'[MOLECON] Error during the login. Final URL: {response.url}')
-                print(f'[MOLECON] Final status code: {response.status_code}')                   
+                logger.error(f'[MOLECON] Error during the login. Final URL: {response.url}')
+                logger.error(f'[MOLECON] Final status code: {response.status_code}')                   
                 return False
 
         except Exception as e:
-            print(f'[MOLECON] Unexpected error: {e}')
+            logger.error(f'[MOLECON] Unexpected error: {e}')
             return False
     
-    def get_challenges(self):
+    def iter_challenges(self):
         if not self.logged_in:
-            print("[MOLECON] Login first")
+            logger.error("[MOLECON] Login first")
             return None
         
         api_url = self.base_url + self.challenges_api_path
-        challenges_response = self._get_page_content(api_url)
+        challenges_response = self._stream_page_content(api_url)
         
         if not challenges_response:
-            print(f"[MOLECON] Cannot GET challenges page at {api_url}")
+            logger.error(f"[MOLECON] Cannot GET challenges page at {api_url}")
             return None
         
+        return self._parse_challenges(challenges_response, api_url)
+    
+    def _parse_challenges(self, challenges_response, api_url):
+        # Challenges are yielded while the list is still downloading
+        to_keep = ["id", "name", "value", "solves", "solved_by_me", "category"]
+        try:
+            for chal in self._iter_json_array(challenges_response, "data"):
+                if not isinstance(chal, dict) or 'id' not in chal:
+                    logger.warning(f"[MOLECON] Skipping challenge without id in {api_url}: {chal}")
+                    continue
+                modified = {}
+                for field in to_keep:
+                    if field in chal:
+                        modified[field] = chal[field]
+                yield ChallengeSummary.from_dict(modified)
+        except IncompleteListError as e:
+            logger.error(f"[MOLECON] Incomplete challenges list from {api_url}: {e}")
+            raise
+    
+    def get_challenges(self):
+        challenges = self.iter_challenges()
+        if challenges is None:
+            return None
         try:
-            data = challenges_response.json()
-        except ValueError: # requests.exceptions.JSONDecodeError
-            print(f"[MOLECON] Cannot decode JSON: {api_url}")
+            return list(challenges)
+        except IncompleteListError:
             return None
-
-        challenges_list = data.get("data", [])
-        parsed_challenges = []
-        to_keep = ["id", "name", "value", "solves", "solved_by_me", "category"]
-        for chal in challenges_list:
-            modified = {}
-            for field in to_keep:
-                if field in chal:
-                    modified[field] = chal[field]
-            parsed_challenges.append(modified)
-            
-        return parsed_challenges
     
     def get_challenge_details(self, challenge_id):
         if not self.logged_in:
-            print("[MOLECON] Login first")
+            logger.error("[MOLECON] Login first")
             return None, None
 
         challenge_api_url = f"{self.base_url}{self.challenges_api_path}/{challenge_id}"
@@ -95,24 +109,28 @@ class WebsiteMolecon(WebsiteConnectorBase):
         solves_response = self._get_page_content(solves_api_url)
         
         if not data_response or not solves_response:
-            print(f"[MOLECON] Cannot get info for the challenge {challenge_id}")
+            logger.error(f"[MOLECON] Cannot get info for the challenge {challenge_id}")
             return None, None
         
         try:
             chal_data_json = data_response.json()
             chal_solves_json = solves_response.json()
         except ValueError:
-             print(f"[MOLECON] Cannot decode JSON for challenge {challenge_id}")
+             logger.error(f"[MOLECON] Cannot decode JSON for challenge {challenge_id}")
              return None, None
 
-        chal_data = chal_data_json.get('data', {})
-        chal_solves = chal_solves_json.get('data', [])
+        chal_data = chal_data_json.get('data') or {}
+        chal_solves = chal_solves_json.get('data') or []
+        if 'id' not in chal_data: # e.g. {"success": false} for a hidden challenge
+            logger.error(f"[MOLECON] No data for the challenge {challenge_id}")
+            return None, None
         
         data_to_keep = ["id", "name", "value", "description", "solves", "solved_by_me", "category", "files"]
         parsed_details = {}
         for field in data_to_keep:
             if field in chal_data:
                 parsed_details[field] = chal_data[field]
+        parsed_details = ChallengeDetails.from_dict(parsed_details) # 'files' is a list of URLs
         
         parsed_solvers = []
         for solver in chal_solves:
@@ -123,7 +141,7 @@ class WebsiteMolecon(WebsiteConnectorBase):
     
     def download_attachment(self, file_relative_url):
         if not self.logged_in:
-            print("[MOLECON] Login first")
+            logger.error("[MOLECON] Login first")
             return None
         
         if not file_relative_url.startswith('/'):
@@ -131,9 +149,9 @@ class WebsiteMolecon(WebsiteConnectorBase):
             
         full_file_url = self.base_url + file_relative_url
         
-        file_response = self._get_page_content(full_file_url)
-        if file_response:
-            return file_response.content
+        file_content = self._download_content(full_file_url)
+        if file_content is not None:
+            return file_content
         else:
-            print(f'[MOLECON] Error while downloading {full_file_url}')
+            logger.error(f'[MOLECON] Error while downloading {full_file_url}')
             return None
\ No newline at end of file
@@ -1,5 +1,9 @@
+import logging
 from bs4 import BeautifulSoup
-from .base_website import WebsiteConnectorBase
+from challenge_record import ChallengeSummary, ChallengeDetails, Attachment
+from .base_website import WebsiteConnectorBase, IncompleteListError
+
+logger = logging.getLogger(__name__)
 
 class WebsiteOliCyber(WebsiteConnectorBase):
     def __init__(self, base_url, username, password):
@@ -16,7 +20,7 @@ class WebsiteOliCyber(WebsiteConnectorBase):
     
     def _get_display_name(self):
         if not self.logged_in:
-            print("[OLICYBER] Login first")
+            logger.error("[OLICYBER] Login first")
             return None
         
         api_url = self.base_url + self.current_user
@@ -26,24 +30,24 @@ class WebsiteOliCyber(WebsiteConnectorBase):
         user_response = self._get_page_content(api_url, headers = headers)
         
         if not user_response:
-            print(f"[OLICYBER] Cannot GET user at {api_url}")
+            logger.error(f"[OLICYBER] Cannot GET user at {api_url}")
             return None
         
         try:
             data = user_response.json()
         except ValueError: # requests.exceptions.JSONDecodeError
-            print(f"[OLICYBER] Cannot decode JSON: {api_url}")
+            logger.error(f"[OLICYBER] Cannot decode JSON: {api_url}")
             return None
         
         if 'name' not in data or 'surname' not in data:
-            print(f"[OLICYBER] Cannot find 'name' or 'surname'")
+            logger.error(f"[OLICYBER] Cannot find 'name' or 'surname'")
             return None
         
         self.display_name = data['name'] + ' ' + data['surname'] + f' ({data['nickname']})'
     
     def login(self):
         if not self.username or not self.password:
-            print("[OLICYBER] Missing credentials")
+            logger.error("[OLICYBER] Missing credentials")
             return False
         
         login_url = self.base_url + self.login_path
@@ -60,11 +64,11 @@ class WebsiteOliCyber(WebsiteConnectorBase):
             try:
                 data = response.json()
             except ValueError: # requests.exceptions.JSONDecodeError
-                print(f"[OLICYBER] Cannot decode JSON: {login_url}")
+                logger.error(f"[OLICYBER] Cannot decode JSON: {login_url}")
                 return False
             
             if 'token' not in data or 'filesToken' not in data:
-                print(f"[OLICYBER] Cannot find 'token' or 'filesToken'")
+                logger.error(f"[OLICYBER] Cannot find 'token' or 'filesToken'")
                 return False
             
             self.token = data['token']
@@ -76,11 +80,11 @@ class WebsiteOliCyber(WebsiteConnectorBase):
             
             return True
         except Exception as e:
-            print(f'[OLICYBER] Unexpected error: {e}')
+            logger.error(f'[OLICYBER] Unexpected error: {e}')
             
-    def get_challenges(self):
+    def iter_challenges(self):
         if not self.logged_in:
-            print("[OLICYBER] Login first")
+            logger.error("[OLICYBER] Login first")
             return None
         
         api_url = self.base_url + self.challenges_path
@@ -88,50 +92,56 @@ class WebsiteOliCyber(WebsiteConnectorBase):
         headers = {
             "Authorization": f"Token {self.token}"
         }
-        challenges_response = self._get_page_content(api_url, headers = headers)
+        challenges_response = self._stream_page_content(api_url, headers = headers)
         
         if not challenges_response:
-            print(f"[OLICYBER] Cannot GET challenges at {api_url}")
+            logger.error(f"[OLICYBER] Cannot GET challenges at {api_url}")
             return None
         
+        return self._parse_challenges(challenges_response, api_url)
+    
+    def _parse_challenges(self, challenges_response, api_url):
+        # Each event is decoded (and its challenges yielded) as soon as it's downloaded
+        found_events = False
         try:
-            data = challenges_response.json()
-        except ValueError: # requests.exceptions.JSONDecodeError
-            print(f"[OLICYBER] Cannot decode JSON: {api_url}")
-            return None
-        
-        if 'events' not in data:
-            print(f"[OLICYBER] Cannot find 'events'")
-            return None
-        
-        events = data['events']
-        parsed_challenges = []
-        to_keep = ["title", "currentScore", "currentGlobalSolves", "tags"]
-        for ev in events:
-            if 'sections' not in ev:
-                print(f"[OLICYBER] Cannot find 'sections', skipping event {ev['name']}")
-                continue
-            
-            sections = ev['sections']
-            for sec in sections:
-                if 'challenges' not in sec:
-                    print(f"[OLICYBER] Cannot find 'sections', skipping event {ev['name']}")
+            for ev in self._iter_json_array(challenges_response, 'events'):
+                found_events = True
+                if 'sections' not in ev:
+                    logger.warning(f"[OLICYBER] Cannot find 'sections', skipping event {ev['name']}")
                     continue
                 
-                challenges_list = sec['challenges']
-                for c in challenges_list:
-                    chal = {}
+                sections = ev['sections']
+                for sec in sections:
+                    if 'challenges' not in sec:
+                        logger.warning(f"[OLICYBER] Cannot find 'challenges', skipping section {sec.get('name')} of event {ev['name']}")
+                        continue
                     
-                    # build ID separately
-                    chal['id'] = c['id']
-                    chal['name'] = c['title'] # Use same naming from other website
-                    chal['value'] = c['currentScore']
-                    chal['solves'] = c['currentGlobalSolves']
-                    chal['category'] = sec['name']
-                    
-                    parsed_challenges.append(chal)
-                    
-        return parsed_challenges
+                    challenges_list = sec['challenges']
+                    for c in challenges_list:
+                        chal = ChallengeSummary(
+                            id = c['id'],
+                            name = c['title'], # Use same naming from other website
+                            value = c['currentScore'],
+                            solves = c['currentGlobalSolves'],
+                            category = sec['name']
+                        )
+                        
+                        yield chal
+        except IncompleteListError as e:
+            logger.error(f"[OLICYBER] Incomplete challenges list from {api_url}: {e}")
+            raise
+        
+        if not found_events:
+            logger.error(f"[OLICYBER] Cannot find 'events'")
+    
+    def get_challenges(self):
+        challenges = self.iter_challenges()
+        if challenges is None:
+            return None
+        try:
+            return list(challenges)
+        except IncompleteListError:
+            return None
                 
     def get_challenge_details(self, challenge_id):
         challenge_api_url = f"{self.base_url}{self.challenges_path}/{challenge_id}"
@@ -142,27 +152,28 @@ class WebsiteOliCyber(WebsiteConnectorBase):
         data_response = self._get_page_content(challenge_api_url, headers = headers)
         
         if not data_response:
-            print(f"[OLICYBER] Cannot get info for the challenge {challenge_id}")
+            logger.error(f"[OLICYBER] Cannot get info for the challenge {challenge_id}")
             return None, None
         
         try:
             chal_data_json = data_response.json()
         except ValueError:
-             print(f"[OLICYBER] Cannot decode JSON for challenge {challenge_id}")
+             logger.error(f"[OLICYBER] Cannot decode JSON for challenge {challenge_id}")
              return None, None
          
-        parsed_details = {}
-        parsed_details['id'] = chal_data_json['id']
-        parsed_details['name'] = chal_data_json['title']
-        parsed_details['value'] = chal_data_json['currentScore']
-        parsed_details['description'] = chal_data_json['description']
-        parsed_details['solves'] = chal_data_json['currentGlobalSolves']
+        parsed_details = ChallengeDetails(
+            id = chal_data_json['id'],
+            name = chal_data_json['title'],
+            value = chal_data_json['currentScore'],
+            description = chal_data_json['description'],
+            solves = chal_data_json['currentGlobalSolves']
+        )
         
         # Parse attchements
         files = []
         for f in chal_data_json['files']:
-            files.append(f['url'])
-        parsed_details['files'] = files
+            files.append(Attachment(f['url']))
+        parsed_details.files = files
         
         # Solvers
         parsed_solvers = []
@@ -170,22 +181,26 @@ class WebsiteOliCyber(WebsiteConnectorBase):
             if 'displayedName' in solver:
                 parsed_solvers.append(solver['displayedName'])
                 
-        parsed_details['solved_by_me'] = self.display_name in parsed_solvers            
+        parsed_details.solved_by_me = self.display_name in parsed_solvers            
                 
         return parsed_details, parsed_solvers
         
+    def is_solved_by_me(self, challenge_details, solvers):
+        # Solvers are listed by display name, no need for other requests
+        return self.display_name in solvers
+    
     def download_attachment(self, file_relative_url):
         if not self.logged_in:
-            print("[OLICYBER] Login first")
+            logger.error("[OLICYBER] Login first")
             return None
         
         if not file_relative_url.startswith('/'):
             file_relative_url = '/' + file_relative_url
         
         full_file_url = self.base_url + file_relative_url
-        file_response = self._get_page_content(full_file_url)
-        if file_response:
-            return file_response.content
+        file_content = self._download_content(full_file_url)
+        if file_content is not None:
+            return file_content
         else:
-            print(f'[OLICYBER] Error while downloading {full_file_url}')
+            logger.error(f'[OLICYBER] Error while downloading {full_file_url}')
             return None
\ No newline at end of file